@@ -0,0 +1,240 @@
+# In app/answer_cache.py
+
+import os
+import json
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+import numpy as np
+from .embeddings import normalize_query
+
+# --- Semantic cache for RAG answers ---
+class SemanticAnswerCache:
+    """
+    Caches LLM answers keyed by the embedding of the (standalone) question.
+    A lookup hits when a cached question is at least `threshold` cosine-similar,
+    was answered against the same FAISS index version and is younger than
+    `ttl_seconds`. The cache holds at most `max_size` answers (least recently
+    used go first) and, when `path` is set, is saved to and restored from a
+    JSON file so restarts don't start cold.
+
+    Identical questions that arrive while the first one is still waiting on
+    the LLM share that single call (see get_or_compute / aget_or_compute).
+    """
+
+    def __init__(self, index_version, threshold=None, ttl_seconds=None, max_size=None, path=None):
+        self.index_version = index_version
+        self.threshold = threshold or float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+        self.ttl_seconds = ttl_seconds or float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+        self.max_size = max_size or int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+        self.path = path if path is not None else os.getenv("ANSWER_CACHE_PATH", "")
+        self.save_interval = 30
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+        self._entries = OrderedDict()  # question -> entry dict, least recently used first
+        self._matrix = None            # unit vectors, one row per slot
+        self._active = np.zeros(self.max_size, dtype=bool)
+        self._slot_questions = [None] * self.max_size
+        self._free_slots = list(range(self.max_size - 1, -1, -1))
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_saved = time.time()
+        self._load()
+
+    # --- Lookup / store ---
+    def lookup(self, vector):
+        """Returns the cached answer for the closest question, or None."""
+        query = _unit(vector)
+        with self._lock:
+            if not self._entries:
+                self.misses += 1
+                return None
+            scores = self._matrix @ query
+            scores[~self._active] = -1.0
+            slot = int(np.argmax(scores))
+            entry = self._entries.get(self._slot_questions[slot])
+            if entry is None or scores[slot] < self.threshold:
+                self.misses += 1
+                return None
+            if entry["index_version"] != self.index_version or time.time() - entry["created_at"] > self.ttl_seconds:
+                self._evict(entry["question"])
+                self.misses += 1
+                return None
+            self._entries.move_to_end(entry["question"])
+            self.hits += 1
+            return entry["answer"]
+
+    def put(self, question, vector, answer):
+        with self._lock:
+            self._store(question, _unit(vector), answer, self.index_version, time.time())
+            self._dirty = True
+            should_save = self.path and time.time() - self._last_saved > self.save_interval
+        if should_save:
+            try:
+                self.save()
+            except Exception as e:
+                # The answer is still served and cached in memory; the next put() tries again.
+                print(f"Error saving answer cache: {e}")
+
+    def set_index_version(self, index_version):
+        """Call after the FAISS index is rebuilt; answers from the old index stop matching."""
+        with self._lock:
+            self.index_version = index_version
+            for question in [q for q, e in self._entries.items() if e["index_version"] != index_version]:
+                self._evict(question)
+            self._dirty = True
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses, "coalesced": self.coalesced}
+
+    # --- Request coalescing ---
+    def get_or_compute(self, question, vector, compute):
+        """Cached answer, or compute() run once for all concurrent callers asking `question`."""
+        answer = self.lookup(vector)
+        while answer is None:
+            future, owner = self.claim(question)
+            if owner:
+                break
+            # None: the owner was cancelled, so take the question over (or wait on whoever did).
+            answer = future.result() or self.lookup(vector)
+        if answer is not None:
+            return answer
+        try:
+            answer = compute()
+        except BaseException as e:
+            self.abandon(question, future, e)
+            raise
+        self.complete(question, vector, future, answer)
+        return answer
+
+    async def aget_or_compute(self, question, vector, acompute):
+        answer = self.lookup(vector)
+        while answer is None:
+            future, owner = self.claim(question)
+            if owner:
+                break
+            answer = await asyncio.wrap_future(future) or self.lookup(vector)
+        if answer is not None:
+            return answer
+        try:
+            answer = await acompute()
+        except BaseException as e:
+            self.abandon(question, future, e)
+            raise
+        self.complete(question, vector, future, answer)
+        return answer
+
+    def claim(self, question):
+        """
+        Returns (future, owner). The first caller for a question becomes the owner and
+        must call complete() or abandon(); everyone after it waits on the future. The
+        future resolves to None when the owner was cancelled: waiters then claim again.
+        """
+        question = normalize_query(question)
+        with self._lock:
+            future = self._inflight.get(question)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = Future()
+            # Running futures can't be cancelled, so a waiter that gives up can't cancel it for the rest.
+            future.set_running_or_notify_cancel()
+            self._inflight[question] = future
+            return future, True
+
+    def complete(self, question, vector, future, answer):
+        try:
+            self.put(question, vector, answer)
+        finally:
+            self._finish(question, future, answer=answer)
+
+    def abandon(self, question, future, error):
+        if not isinstance(error, Exception):
+            # Cancellation / a closed stream on the owner's side says nothing about the question:
+            # resolve to None so the waiters reclaim it and one of them computes the answer.
+            self._finish(question, future)
+            return
+        self._finish(question, future, error=error)
+
+    def _finish(self, question, future, answer=None, error=None):
+        with self._lock:
+            self._inflight.pop(normalize_query(question), None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(answer)
+
+    # --- Storage helpers (call with the lock held) ---
+    def _store(self, question, unit_vector, answer, index_version, created_at):
+        if question in self._entries:
+            self._evict(question)
+        while not self._free_slots:
+            self._evict(next(iter(self._entries)))
+        if self._matrix is None:
+            self._matrix = np.zeros((self.max_size, unit_vector.shape[0]), dtype=np.float32)
+        slot = self._free_slots.pop()
+        self._matrix[slot] = unit_vector
+        self._active[slot] = True
+        self._slot_questions[slot] = question
+        self._entries[question] = {
+            "question": question, "answer": answer, "slot": slot,
+            "index_version": index_version, "created_at": created_at,
+        }
+
+    def _evict(self, question):
+        entry = self._entries.pop(question)
+        self._slot_questions[entry["slot"]] = None
+        self._active[entry["slot"]] = False
+        self._free_slots.append(entry["slot"])
+
+    # --- Persistence ---
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            payload = [
+                {**{k: v for k, v in entry.items() if k != "slot"}, "vector": self._matrix[entry["slot"]].tolist()}
+                for entry in self._entries.values()
+            ]
+            self._dirty = False
+            self._last_saved = time.time()
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(payload, f)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            with self._lock:
+                self._dirty = True
+            raise
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                payload = json.load(f)
+        except Exception as e:
+            print(f"Error reading answer cache: {e}")
+            return
+        now = time.time()
+        with self._lock:
+            for item in payload[-self.max_size:]:
+                if item["index_version"] != self.index_version or now - item["created_at"] > self.ttl_seconds:
+                    continue
+                vector = np.asarray(item["vector"], dtype=np.float32)
+                self._store(item["question"], vector, item["answer"], item["index_version"], item["created_at"])
+        print(f"✅ Loaded {len(self._entries)} cached answers from {self.path}.")
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
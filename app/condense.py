@@ -0,0 +1,99 @@
+# In app/condense.py
+
+import os
+import re
+
+# --- Word lists ---
+# Words that point back at something said earlier.
+REFERRING_WORDS = {"it", "its", "this", "that", "these", "those", "same", "above", "former", "latter"}
+DEMONSTRATIVES = {"this", "that", "these", "those"}
+# "does this apply" refers back; "this year" does not.
+COMMON_VERBS = {
+    "apply", "applies", "mean", "means", "include", "includes", "cover", "covers", "cost", "costs",
+    "work", "works", "count", "counts", "take", "takes", "require", "requires", "allow", "allows", "change", "changes",
+}
+# "is this mandatory" asks about the earlier topic; "this year" / "this week" name their own.
+AUXILIARIES = {"is", "are", "was", "were", "does", "do", "did", "can", "will", "would", "should", "could", "has", "have"}
+TIME_WORDS = {"year", "years", "month", "months", "week", "weeks", "quarter", "day", "days", "time", "season"}
+# Pronouns that usually refer to a person named in an earlier answer; only the LLM can resolve them.
+PERSON_WORDS = {"he", "she", "him", "his", "her", "hers", "they", "them", "their", "theirs"}
+QUESTION_WORDS = {"what", "how", "when", "where", "who", "whom", "which", "why"}
+STOPWORDS = QUESTION_WORDS | {
+    "is", "are", "was", "were", "be", "do", "does", "did", "can", "could", "should", "would", "will", "may",
+    "i", "me", "my", "we", "our", "us", "you", "your", "the", "a", "an", "of", "for", "to", "in", "on", "at",
+    "about", "with", "and", "or", "but", "also", "so", "then", "please", "tell", "there", "any", "much", "many",
+}
+# "and for interns" adds to the last question; "what about interns" swaps part of it out.
+ADDITIVE_LEADS = ("and ", "also ", "plus ", "but ", "or ")
+# "for interns?" / "on fridays?" can only narrow the last question; "gratuity" or "thanks" is something new.
+NARROWING_LEADS = ("for ", "on ", "in ", "during ", "after ", "before ", "at ", "with ", "without ")
+SUBSTITUTING_LEADS = ("what about", "how about", "what if", "same for", "and what about")
+# "what is the dress code" -> topic "dress code", so "does it apply on fridays" can name it.
+TOPIC_PATTERN = re.compile(
+    r"^(?:what\s+(?:is|are)|tell\s+me\s+about|explain|describe)\s+(?:the\s+|our\s+|a\s+|an\s+)?(?P<topic>[a-z0-9' -]+?)\s*\??$"
+)
+
+# --- Local follow-up rewriting ---
+class QuestionRewriter:
+    """
+    Decides, without the LLM, how a follow-up needs to be turned into a
+    standalone question before retrieval:
+      "as_is"  - it names its own subject ("what is the notice period?")
+      "local"  - a short fragment starting with "and/also/for/on ..." or a
+                 single "it/this/that" that can be filled in from the
+                 previous question
+      "remote" - anything ambiguous (people, "what about ...", several
+                 references); the condense LLM call handles these
+    CONDENSE_MODE=remote sends every follow-up to the LLM, as before.
+    """
+
+    def __init__(self, mode=None):
+        self.mode = mode or os.getenv("CONDENSE_MODE", "local")
+        self.counts = {"as_is": 0, "local": 0, "remote": 0}
+
+    def rewrite(self, query, previous_question):
+        """Returns (question, route); question is None when route is "remote"."""
+        question, route = self._rewrite(query, previous_question)
+        self.counts[route] += 1
+        return question, route
+
+    def _rewrite(self, query, previous_question):
+        if self.mode == "remote":
+            return None, "remote"
+        lower = query.strip().lower()
+        words = re.findall(r"[a-z0-9']+", lower)
+        referring = [w for i, w in enumerate(words) if w in REFERRING_WORDS and not _is_determiner(words, i)]
+        people = any(w in PERSON_WORDS for w in words)
+        content = [w for w in words if w not in STOPWORDS and w not in REFERRING_WORDS and w not in PERSON_WORDS]
+        if not referring and not people and not lower.startswith(ADDITIVE_LEADS + SUBSTITUTING_LEADS) and len(content) >= 2:
+            return query, "as_is"
+        if not previous_question or people or lower.startswith(SUBSTITUTING_LEADS):
+            return None, "remote"
+
+        previous = previous_question.strip().rstrip("?.! ")
+        if len(referring) == 1 and referring[0] in ("it", "its", "this", "that"):
+            match = TOPIC_PATTERN.match(previous.lower())
+            if match:
+                topic = match.group("topic")
+                replacement = f"the {topic}'s" if referring[0] == "its" else f"the {topic}"
+                return re.sub(rf"\b{referring[0]}\b", replacement, query, count=1, flags=re.IGNORECASE), "local"
+            return None, "remote"
+        if not referring and not (set(words) & QUESTION_WORDS) and len(words) <= 4:
+            if lower.startswith(ADDITIVE_LEADS + NARROWING_LEADS):
+                # A fragment like "and on fridays?" narrows the previous question.
+                fragment = re.sub(r"^(?:and|also|plus|but|or)\s+", "", lower).rstrip("?.! ")
+                return f"{previous} {fragment}?", "local"
+            # "gratuity", "Bonus?", "thanks": a new topic (or none), not part of the last question.
+            return query, "as_is"
+        return None, "remote"
+
+def _is_determiner(words, i):
+    """True for "this year"-style demonstratives, which name their own subject."""
+    if words[i] not in DEMONSTRATIVES or i + 1 >= len(words):
+        return False
+    following = words[i + 1]
+    if following.split("'")[0] in TIME_WORDS:  # "this year's bonus" too
+        return True
+    if i == 1 and words[0] in AUXILIARIES:
+        return False  # "is this mandatory", "does that include interns": the pronoun is the subject
+    return following not in STOPWORDS and following not in COMMON_VERBS
@@ -0,0 +1,144 @@
+# In app/context.py
+
+import os
+import re
+import threading
+from collections import OrderedDict
+import numpy as np
+from .memory import estimate_tokens
+
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\s*[•▪●◦]\s*|\n\s*\n")
+
+def split_sentences(text, max_chars=400):
+    """Splits a PDF chunk into sentences; over-long runs (tables, lists without punctuation) are split at line breaks."""
+    sentences = []
+    for piece in _SENTENCE_BREAK.split(text):
+        lines = piece.split("\n") if len(piece) > max_chars else [piece]
+        sentences += [" ".join(line.split()) for line in lines]
+    return [s for s in sentences if s]
+
+def _trim_overlap(kept, text, min_chars=20):
+    """`text` without the words it shares with the end or the start of `kept` (at least `min_chars` of them)."""
+    a, b = kept.lower(), text.lower()
+    for size in range(min(len(a), len(b)) - 1, min_chars - 1, -1):
+        if a.endswith(b[:size]) and (size == len(b) or b[size] == " "):
+            return text[size:].strip()
+        if a.startswith(b[-size:]) and b[-size - 1] == " ":
+            return text[:-size].strip()
+    return text
+
+# --- Prompt context within a token budget ---
+class ContextPacker:
+    """
+    Builds the {context} for CUSTOM_PROMPT from a wider set of retrieved
+    chunks than the prompt could hold whole. Repeats are dropped first: a
+    sentence that is contained in, or at least CONTEXT_DEDUP_SIMILARITY
+    cosine-similar to, one already kept (the overlap between neighbouring
+    chunks cuts sentences in half, so exact matching misses most of it), and
+    a whole chunk once CONTEXT_CHUNK_OVERLAP of its sentences are repeats of
+    better-ranked ones. Every remaining sentence is scored against the
+    question vector, and the best are packed until CONTEXT_MAX_TOKENS is
+    reached. Sentences are emitted in their original
+    order, grouped by chunk, so the LLM still reads coherent passages.
+    CONTEXT_PACKING=0 goes back to pasting the top two chunks whole.
+    """
+
+    def __init__(self, encoder, enabled=None, candidates=None, max_tokens=None, dedup_similarity=None, chunk_overlap=None, cache_size=4096):
+        self.encoder = encoder
+        self.enabled = enabled if enabled is not None else os.getenv("CONTEXT_PACKING", "1") == "1"
+        self.candidates = candidates or int(os.getenv("CONTEXT_CANDIDATES", "6"))
+        self.max_tokens = max_tokens or int(os.getenv("CONTEXT_MAX_TOKENS", "160"))
+        self.dedup_similarity = dedup_similarity or float(os.getenv("CONTEXT_DEDUP_SIMILARITY", "0.95"))
+        self.chunk_overlap = chunk_overlap or float(os.getenv("CONTEXT_CHUNK_OVERLAP", "0.7"))
+        self.cache_size = cache_size
+        # The same policy chunks come back all day; their sentence vectors are kept.
+        self._vectors = OrderedDict()
+        self._lock = threading.Lock()
+
+    def pack(self, question_vector, docs):
+        """Returns the context string for `docs` (best first)."""
+        # Headings and page numbers are too short to be worth a place.
+        candidates = [
+            (rank, position, sentence)
+            for rank, doc in enumerate(docs)
+            for position, sentence in enumerate(split_sentences(doc.page_content))
+            if len(sentence) >= 15
+        ]
+        if not candidates:
+            return ""
+        vectors = self._sentence_vectors([text for _, _, text in candidates])
+        kept = self._distinct(candidates, vectors, len(docs))
+        sentences = [(candidates[i][0], candidates[i][1], text) for i, text in kept]
+        vectors = vectors[[i for i, _ in kept]]
+
+        query = np.asarray(question_vector, dtype=np.float32)
+        scores = vectors @ (query / max(np.linalg.norm(query), 1e-12))
+
+        chosen, used = [], 0
+        for index in np.argsort(-scores):
+            tokens = estimate_tokens(sentences[index][2])
+            if used + tokens > self.max_tokens:
+                if chosen:
+                    continue  # a shorter sentence further down may still fit
+                # Never send an empty context: keep the best sentence even if it alone is over budget.
+            chosen.append(sentences[index])
+            used += tokens
+        chosen.sort()
+        passages = []
+        for rank in sorted({rank for rank, _, _ in chosen}):
+            passages.append(" ".join(text for r, _, text in chosen if r == rank))
+        return "\n\n".join(passages)
+
+    def _distinct(self, candidates, vectors, chunk_count):
+        """
+        (index, text) for the candidate sentences left once repeats and
+        mostly-repeated chunks are dropped. The text is trimmed where a
+        sentence starts (or ends) with the words another one ends (or starts)
+        with, which is what a chunk boundary cutting through both leaves.
+        """
+        kept = {}  # candidate index -> text, in the order they were kept
+        for rank in range(chunk_count):
+            added, superseded, repeats = {}, set(), 0
+            indices = [i for i, (r, _, _) in enumerate(candidates) if r == rank]
+            for i in indices:
+                text = candidates[i][2]
+                pool = {**kept, **added}
+                if any(text.lower() in other.lower() for other in pool.values()):
+                    repeats += 1
+                    continue
+                # A fragment cut off by the chunk boundary gives way to the whole sentence.
+                shorter = {j for j, other in pool.items() if other.lower() in text.lower()}
+                if not shorter and pool and float(np.max(vectors[list(pool)] @ vectors[i])) >= self.dedup_similarity:
+                    repeats += 1
+                    continue
+                for other in pool.values():
+                    text = _trim_overlap(other, text)
+                if len(text) < 15:
+                    repeats += 1
+                    continue
+                if shorter & kept.keys() or text != candidates[i][2]:
+                    repeats += 1
+                superseded |= shorter
+                added = {j: t for j, t in added.items() if j not in shorter}
+                added[i] = text
+            if rank and indices and repeats >= self.chunk_overlap * len(indices):
+                continue  # a near-copy of a better-ranked chunk: nothing new worth its tokens
+            kept = {**{j: t for j, t in kept.items() if j not in superseded}, **added}
+        return list(kept.items())
+
+    def _sentence_vectors(self, sentences):
+        """Unit-length vectors for `sentences`, encoding only those not cached."""
+        with self._lock:
+            found = {s: self._vectors[s] for s in sentences if s in self._vectors}
+            for sentence in found:
+                self._vectors.move_to_end(sentence)
+        missing = [s for s in dict.fromkeys(sentences) if s not in found]
+        if missing:
+            encoded = np.asarray(self.encoder.encode(missing), dtype=np.float32)
+            encoded = encoded / np.maximum(np.linalg.norm(encoded, axis=1, keepdims=True), 1e-12)
+            with self._lock:
+                for sentence, vector in zip(missing, encoded):
+                    found[sentence] = self._vectors[sentence] = vector
+                while len(self._vectors) > self.cache_size:
+                    self._vectors.popitem(last=False)
+        return np.stack([found[s] for s in sentences])
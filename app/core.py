@@ -1,83 +1,52 @@
 # In app/core.py
 
 import os
-import smtplib
-import json
+import asyncio
+import time
+import threading
+import contextvars
 from datetime import date, timedelta
-from email.message import EmailMessage
-from langchain.vectorstores import FAISS
-from langchain_community.embeddings import SentenceTransformerEmbeddings
-from langchain.chat_models import ChatOpenAI
-from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
+from concurrent.futures import ThreadPoolExecutor
+from langchain.chains.conversational_retrieval.prompts import CONDENSE_QUESTION_PROMPT
 from langchain.prompts import PromptTemplate
-from sentence_transformers import SentenceTransformer, util
-import torch
+from langchain_core.output_parsers import StrOutputParser
 from dotenv import load_dotenv
-import mimetypes
+from .answer_cache import SemanticAnswerCache
+from .condense import QuestionRewriter
+from .directory import load_employee_directory
+from .embedding_service import EmbeddingServiceClient, RemoteEncoder, RemoteIndex
+from .embeddings import BatchingEncoder, QueryEmbeddingCache, SharedEncoder
+from .intents import IntentRouter
+from .llm_client import build_chat_model
+from .index_store import get_index_version, load_index, read_manifest
+from .memory import estimate_tokens
+from .metrics import LLM_TOKENS, annotate, set_tier, stage
+from .outbox import EmailOutbox
+from .sessions import SessionStore
+from .faqs import FaqMatcher
+from .extractive import ExtractiveAnswerer, l2_to_cosine
+from .context import ContextPacker
+from .precomputed import PrecomputedAnswers
+from .uploads import UploadStore
 
 load_dotenv()
 
-# --- Conversation State Manager ---
-conversation_state = {}
-
 # --- Helper Functions ---
-def get_employee_data(employee_id):
-    try:
-        with open("data/employees.json", 'r') as f:
-            employees = json.load(f)
-            for emp in employees:
-                if emp["employee_id"].lower() == employee_id.lower():
-                    return emp
-    except Exception as e:
-        print(f"Error reading employee data: {e}")
-        return None
-    return None
-
-def send_email(to_address, subject, body, attachment_path=None):
-    # Load credentials from the .env file
-    SENDER_EMAIL = os.getenv("SENDER_EMAIL")
-    SENDER_PASSWORD = os.getenv("SENDER_PASSWORD")
-
-    if not SENDER_EMAIL or not SENDER_PASSWORD:
-        print("❌ ERROR: SENDER_EMAIL or SENDER_PASSWORD not set in .env file. Cannot send real email.")
-        # Fallback to simulation if credentials are not set
-        print("--- SIMULATING EMAIL SEND ---")
-        print(f"To: {to_address}\nSubject: {subject}\nBody:{body}")
-        if attachment_path: print(f"Attachment: {attachment_path}")
-        print("---------------------------")
-        return False
-
-    # Create the email message object
-    msg = EmailMessage()
-    msg.set_content(body)
-    msg['Subject'] = subject
-    msg['From'] = SENDER_EMAIL
-    msg['To'] = to_address
-
-    # If there is an attachment, add it to the email
-    if attachment_path and os.path.exists(attachment_path):
-        ctype, encoding = mimetypes.guess_type(attachment_path)
-        if ctype is None or encoding is not None:
-            ctype = 'application/octet-stream'
-        maintype, subtype = ctype.split('/', 1)
-        with open(attachment_path, 'rb') as fp:
-            msg.add_attachment(fp.read(),
-                               maintype=maintype,
-                               subtype=subtype,
-                               filename=os.path.basename(attachment_path))
-    
-    # Connect to the Gmail server and send the email
-    try:
-        server = smtplib.SMTP_SSL('smtp.gmail.com', 465)
-        server.login(SENDER_EMAIL, SENDER_PASSWORD)
-        server.send_message(msg)
-        server.quit()
-        print(f"✅ Email successfully sent to {to_address}")
-        return True
-    except Exception as e:
-        print(f"❌ Failed to send email: {e}")
-        return False
+def _record_llm_tokens(call, prompt, inputs, output):
+    # Estimated locally: the chains end in StrOutputParser, so the provider's usage numbers are gone.
+    LLM_TOKENS.inc(estimate_tokens(prompt.format(**inputs)), call=call, direction="in")
+    LLM_TOKENS.inc(estimate_tokens(output), call=call, direction="out")
+
+def _format_chat_history(messages):
+    # Same "Human:/Assistant:" layout ConversationalRetrievalChain fed to the condense prompt.
+    lines = []
+    for message in messages:
+        if message.type == "system":
+            lines.append(message.content)  # TokenBudgetMemory's summary of older turns
+            continue
+        role = "Human" if message.type == "human" else "Assistant"
+        lines.append(f"{role}: {message.content}")
+    return "\n".join(lines)
 
 # --- Prompt Template (Unchanged) ---
 custom_prompt_template = """Use the following pieces of context to answer the question at the end. 
@@ -95,70 +64,101 @@ CUSTOM_PROMPT = PromptTemplate(
 
 # --- Main Chatbot Class ---
 class ChatbotCore:
-    def __init__(self, faiss_path="data/mpc_faiss_index"):
+    def __init__(self, faiss_path="data/mpc_faiss_index", max_workers=None, max_llm_calls=None, llm=None, outbox=None, uploads=None):
         print("Initializing ChatbotCore...")
-        self._load_models(faiss_path)
-        self.memory = ConversationBufferMemory(
-            memory_key="chat_history", return_messages=True, output_key="answer"
-        )
+        # Embedding, FAISS search and the task flows run here instead of on the event loop.
+        # Threads are enough: torch and faiss release the GIL while they compute.
+        self.max_workers = max_workers or int(os.getenv("CHAT_MAX_WORKERS", "4"))
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="chatbot")
+        self.max_llm_calls = max_llm_calls or int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+        self._llm_semaphore = None
+        self._load_models(faiss_path, llm)
+        # Intent keywords are compiled once; INTENT_CLASSIFIER=1 adds the embedding fallback.
+        use_classifier = os.getenv("INTENT_CLASSIFIER", "0") == "1"
+        self.router = IntentRouter(encoder=self.encoder if use_classifier else None)
+        # Task-flow state and chat history live per widget session, never on the instance.
+        self.sessions = SessionStore()
+        self.directory = load_employee_directory()
+        # Confirmation emails are queued and sent by a background worker.
+        self.outbox = outbox or EmailOutbox()
+        self.uploads = uploads or UploadStore()
+        # The sender attaches the compressed receipt, so confirming a claim never waits for it.
+        self.outbox.prepare_attachment = self.uploads.receipts.attachment
         self._setup_chains()
-        self._setup_manual_qa()
+        # faqs.json, re-read when it changes; see app/faqs.py.
+        self.faqs = FaqMatcher(self.encoder)
         print("✅ ChatbotCore Initialized.")
     
-    def reset_conversation_state(self):
-        global conversation_state
-        conversation_state = {}
+    def reset_conversation_state(self, session_id=None):
+        self.sessions.get(session_id).state.clear()
         print("Conversation task state cleared.")
 
-    def _load_models(self, faiss_path):
-        self.embedding_model = SentenceTransformerEmbeddings(model_name="all-MiniLM-L6-v2")
-        self.db = FAISS.load_local(
-            faiss_path, self.embedding_model, allow_dangerous_deserialization=True
-        )
+    def _load_models(self, faiss_path, llm=None):
+        self.faiss_path = faiss_path
+        self.embedding_service = None
+        if os.getenv("EMBEDDING_SERVICE_SOCKET"):
+            # Model and index live in `python -m app.embedding_service`, shared by every worker.
+            self.embedding_service = EmbeddingServiceClient()
+            self.encoder = RemoteEncoder(self.embedding_service)
+            self.db = RemoteIndex(self.embedding_service)
+            self.index_version = self.db.index_version()
+        else:
+            # The only MiniLM instance in the process; the FAQ matcher reuses it.
+            self.encoder = SharedEncoder()
+            if os.getenv("ENCODER_BATCHING", "1") == "1":
+                # Concurrent requests' query encodes share forward passes.
+                self.encoder = BatchingEncoder(self.encoder)
+            self.db = load_index(faiss_path, self.encoder)
+            self.index_version = get_index_version(faiss_path)
+        self.query_cache = QueryEmbeddingCache(self.encoder)
+        # app.ingest can republish the index under a running process; see _maybe_reload_index.
+        self.index_check_interval = float(os.getenv("INDEX_CHECK_SECONDS", "30"))
+        self._next_index_check = time.monotonic() + self.index_check_interval
+        self._index_lock = threading.Lock()
+        if llm is not None:
+            # Any LangChain chat model works; bench_chatbot.py passes an offline stub.
+            self.llm = llm
+            return
         api_key = os.getenv("TOGETHERAI_API_KEY")
         if not api_key:
             raise ValueError("TOGETHERAI_API_KEY environment variable not set.")
-        self.llm = ChatOpenAI(
-            openai_api_key=api_key, model_name="mistralai/Mistral-7B-Instruct-v0.2",
-            base_url="https://api.together.xyz/v1", temperature=0.2, max_tokens=512
-        )
+        # Pooled connections, timeouts, retries and optional hedging; see app/llm_client.py.
+        self.llm = build_chat_model(api_key)
 
     def _setup_chains(self):
-        self.qa_chain = ConversationalRetrievalChain.from_llm(
-            llm=self.llm,
-            retriever=self.db.as_retriever(search_kwargs={'k': 2}),
-            memory=self.get_memory(),
-            combine_docs_chain_kwargs={"prompt": CUSTOM_PROMPT}
-        )
-
-    def _setup_manual_qa(self):
-        faq_path = "data/faqs.json"
-        try:
-            with open(faq_path, 'r') as f:
-                self.manual_qa = json.load(f)
-            print("✅ Manual FAQs loaded successfully from faqs.json.")
-        except Exception:
-            self.manual_qa = {}
-        
-        self.faq_encoder = SentenceTransformer('all-MiniLM-L6-v2')
-        self.faq_questions = list(self.manual_qa.keys())
-        self.faq_embeddings = self.faq_encoder.encode(self.faq_questions, convert_to_tensor=True)
-
-    def get_memory(self):
-        return self.memory
-
-    def _get_manual_answer(self, query, threshold=0.75):
-        if not self.faq_questions:
-            return None
-        query_embedding = self.faq_encoder.encode(query, convert_to_tensor=True)
-        cosine_scores = util.pytorch_cos_sim(query_embedding, self.faq_embeddings)[0]
-        top_result = torch.topk(cosine_scores, k=1)
-        if top_result.values.item() >= threshold:
-            return self.manual_qa[self.faq_questions[top_result.indices.item()]]
-        return None
-
-    def handle_leave_application(self, query):
-        global conversation_state
+        # The two LLM steps of a conversational retrieval chain. Retrieval runs between
+        # them in _retrieve, so it can search with the vector the FAQ check already computed.
+        # Answers are cached by question vector and tied to the index they came from.
+        self.condense_chain = CONDENSE_QUESTION_PROMPT | self.llm | StrOutputParser()
+        # Most follow-ups are rewritten locally; the condense call is the last resort.
+        self.rewriter = QuestionRewriter()
+        self.qa_chain = CUSTOM_PROMPT | self.llm | StrOutputParser()
+        # Packing retrieves more chunks than fit whole and keeps their best sentences.
+        self.context_packer = ContextPacker(self.encoder)
+        self.retrieval_k = self.context_packer.candidates if self.context_packer.enabled else 2
+        self.answer_cache = SemanticAnswerCache(self.index_version)
+        # Answers built offline by `python -m app.precompute`, checked before the answer cache.
+        self.precomputed = PrecomputedAnswers()
+        # EXTRACTIVE_ANSWERS=1 quotes a close enough top chunk instead of calling the LLM.
+        self.extractive = ExtractiveAnswerer()
+
+    def warmup(self):
+        """
+        Runs the encoder, FAQ matcher and FAISS search once on throwaway input so
+        torch's kernels, the FAISS pages and the FAQ matrix are ready before the
+        first real message. Nothing is cached and the LLM is not called.
+        """
+        started = time.perf_counter()
+        vectors = self.encoder.encode(["warmup", "What is the leave policy?"])
+        self.faqs.match(vectors[1])
+        self.db.similarity_search_by_vector(vectors[1], k=self.retrieval_k)
+        print(f"✅ Warmup finished in {time.perf_counter() - started:.2f}s.")
+
+    def get_memory(self, session_id=None):
+        return self.sessions.get(session_id).memory
+
+    def handle_leave_application(self, query, session_id=None):
+        conversation_state = self.sessions.get(session_id).state
         employee_data = conversation_state.get("employee_data", {})
         
         if conversation_state.get("leave_type") is None:
@@ -183,19 +183,19 @@ class ChatbotCore:
                 conversation_state["confirmed"] = True
                 subject = f"New Leave Request from {employee_data.get('full_name', 'N/A')}"
                 body = f"Employee: {employee_data.get('full_name')} (ID: {employee_data.get('employee_id')})\nLeave Type: {conversation_state.get('leave_type')}\nDates: {conversation_state.get('dates')}"
-                send_email("sunil.kumar2@mpccloudconsulting.com", subject, body)
-                self.reset_conversation_state()
+                self.outbox.enqueue("sunil.kumar2@mpccloudconsulting.com", subject, body)
+                self.reset_conversation_state(session_id)
                 return "Thank you. I have forwarded your leave request to the HR department. You will hear from them soon."
             else:
-                self.reset_conversation_state()
+                self.reset_conversation_state(session_id)
                 return "Okay, I've cancelled the leave application process."
         
-        self.reset_conversation_state()
+        self.reset_conversation_state(session_id)
         return "Sorry, something went wrong. Let's start over."
 
     # --- NEW: Logic for handling the multi-step expense claim ---
-    def handle_expense_claim(self, query):
-        global conversation_state
+    def handle_expense_claim(self, query, session_id=None):
+        conversation_state = self.sessions.get(session_id).state
         employee_data = conversation_state.get("employee_data", {})
 
         if conversation_state.get("expense_type") is None:
@@ -213,7 +213,11 @@ class ChatbotCore:
 
         if conversation_state.get("receipt_path") is None:
             if "receipt_uploaded:" in query:
-                conversation_state["receipt_path"] = query.split(":", 1)[1].strip()
+                # Only receipts /upload stored can be attached, never an arbitrary path from the chat.
+                receipt_path = self.uploads.resolve(query.split(":", 1)[1])
+                if receipt_path is None:
+                    return "I couldn't find that receipt. Please upload it again using the button."
+                conversation_state["receipt_path"] = receipt_path
                 exp_type = conversation_state['expense_type']
                 amount = conversation_state['amount']
                 exp_date = conversation_state['date']
@@ -226,28 +230,315 @@ class ChatbotCore:
                 conversation_state["confirmed"] = True
                 subject = f"New Expense Claim from {employee_data['full_name']}"
                 body = f"Employee: {employee_data['full_name']} (ID: {employee_data['employee_id']})\nType: {conversation_state['expense_type']}\nAmount: {conversation_state['amount']}\nDate: {conversation_state['date']}"
-                send_email("sunil.kumar2@mpccloudconsulting.com", subject, body, conversation_state["receipt_path"])
-                self.reset_conversation_state()
+                self.outbox.enqueue("sunil.kumar2@mpccloudconsulting.com", subject, body, conversation_state["receipt_path"])
+                self.reset_conversation_state(session_id)
                 return "Thank you. Your expense claim has been submitted to the finance department for approval."
             else:
-                self.reset_conversation_state()
+                self.reset_conversation_state(session_id)
                 return "Okay, I've cancelled the expense claim."
         
-        self.reset_conversation_state()
+        self.reset_conversation_state(session_id)
         return "Sorry, something went wrong with the claim process."
 
+    def get_answer(self, query, session_id=None):
+        session = self.sessions.get(session_id)
+        answer, query_vector = self._answer_locally(query, session)
+        if answer is not None:
+            return answer
+        question, question_vector = self._standalone_question(query, session, query_vector)
+        answer = self._precomputed_answer(question_vector)
+        if answer is None:
+            set_tier("answer_cache")  # _generate_answer switches this to "rag" on a miss
+            answer = self.answer_cache.get_or_compute(
+                question, question_vector, lambda: self._generate_answer(question, question_vector)
+            )
+        session.memory.save_context({"question": query}, {"answer": answer})
+        return answer
+
+    async def aget_answer(self, query, session_id=None):
+        """Async twin of get_answer: CPU work goes to the worker pool, the LLM calls are awaited."""
+        session = self.sessions.get(session_id)
+        answer, query_vector = await self._aanswer_locally(query, session)
+        if answer is not None:
+            return answer
+        question, question_vector = await self._astandalone_question(query, session, query_vector)
+        answer = self._precomputed_answer(question_vector)
+        if answer is None:
+            set_tier("answer_cache")
+            answer = await self.answer_cache.aget_or_compute(
+                question, question_vector, lambda: self._agenerate_answer(question, question_vector)
+            )
+        session.memory.save_context({"question": query}, {"answer": answer})
+        return answer
+
+    async def astream_answer(self, query, session_id=None):
+        """
+        Yields (kind, text) pairs. Task-flow, FAQ and cached replies come as one ("answer", text);
+        fresh RAG replies come as ("token", text) pieces while the LLM is still generating.
+        """
+        session = self.sessions.get(session_id)
+        answer, query_vector = await self._aanswer_locally(query, session)
+        if answer is not None:
+            yield "answer", answer
+            return
+
+        question, question_vector = await self._astandalone_question(query, session, query_vector)
+        answer = self._precomputed_answer(question_vector)
+        if answer is not None:
+            session.memory.save_context({"question": query}, {"answer": answer})
+            yield "answer", answer
+            return
+        answer = self.answer_cache.lookup(question_vector)
+        while answer is None:
+            future, owner = self.answer_cache.claim(question)
+            if owner:
+                break
+            answer = await asyncio.wrap_future(future) or self.answer_cache.lookup(question_vector)
+        if answer is not None:
+            set_tier("answer_cache")
+            session.memory.save_context({"question": query}, {"answer": answer})
+            yield "answer", answer
+            return
+
+        set_tier("rag")
+        tokens = []
+        try:
+            answer, inputs, _ = await self._in_executor(self._prepare_answer, question, question_vector)
+            if answer is not None:
+                self.answer_cache.complete(question, question_vector, future, answer)
+                session.memory.save_context({"question": query}, {"answer": answer})
+                yield "answer", answer
+                return
+            async with self._llm_slots():
+                with stage("llm"):
+                    async for token in self.qa_chain.astream(inputs):
+                        if token:
+                            tokens.append(token)
+                            yield "token", token
+        except BaseException as e:
+            self.answer_cache.abandon(question, future, e)
+            raise
+        answer = "".join(tokens)
+        _record_llm_tokens("answer", CUSTOM_PROMPT, inputs, answer)
+        self.answer_cache.complete(question, question_vector, future, answer)
+        session.memory.save_context({"question": query}, {"answer": answer})
+
+    def _answer_locally(self, query, session):
+        """
+        Runs every tier that doesn't need the LLM. Returns (answer, query_vector);
+        answer is None when RAG has to take over, and query_vector is then the
+        FAQ-check embedding, handed on so the query is only encoded once.
+        """
+        answer = self._task_answer(query, session)
+        if answer is not None:
+            return answer, None
+        # Priority 4: Fallback to Manual FAQ
+        with stage("faq_encode"):
+            query_vector = self.query_cache.get(query)
+        return self._faq_answer(query_vector), query_vector
+
+    async def _aanswer_locally(self, query, session):
+        """
+        _answer_locally for the async paths. With the batching encoder the query
+        encode is awaited on the event loop rather than holding a worker
+        thread, so one forward pass can take every request in flight, not
+        just CHAT_MAX_WORKERS of them.
+        """
+        if not isinstance(self.encoder, BatchingEncoder):
+            return await self._in_executor(self._answer_locally, query, session)
+        answer = await self._in_executor(self._task_answer, query, session)
+        if answer is not None:
+            return answer, None
+        with stage("faq_encode"):
+            query_vector = await self.query_cache.aget(query)
+        return await self._in_executor(self._faq_answer, query_vector), query_vector
+
+    def _task_answer(self, query, session):
+        with session.lock:
+            answer = self._route(query, session)
+        if answer is not None:
+            set_tier("task_flow")
+        return answer
+
+    def _faq_answer(self, query_vector):
+        with stage("faq_match"):
+            answer = self.faqs.match(query_vector)
+        if answer is None:
+            self._maybe_reload_index()
+        else:
+            set_tier("faq")
+        return answer
+
+    def _maybe_reload_index(self):
+        """Swaps in an index republished by app.ingest once its manifest and files agree."""
+        if time.monotonic() < self._next_index_check:
+            return
+        with self._index_lock:
+            if time.monotonic() < self._next_index_check:
+                return
+            self._next_index_check = time.monotonic() + self.index_check_interval
+            if self.embedding_service is not None:
+                # The service reloads the index itself; only the answer cache needs retagging here.
+                try:
+                    version = self.db.index_version()
+                except Exception as e:
+                    print(f"Error checking the embedding service's index: {e}")
+                    return
+                if version != self.index_version:
+                    self.index_version = version
+                    self.answer_cache.set_index_version(version)
+                return
+            manifest = read_manifest(self.faiss_path)
+            if not manifest or manifest.get("index_version") == self.index_version:
+                return
+            try:
+                db = load_index(self.faiss_path, self.encoder)
+                version = get_index_version(self.faiss_path)
+            except Exception as e:
+                print(f"Error reloading FAISS index: {e}")
+                return
+            if version != manifest["index_version"]:
+                return  # Caught ingest mid-publish; the next check will see the finished files.
+            self.db, self.index_version = db, version
+            self.answer_cache.set_index_version(version)
+            print(f"✅ Reloaded FAISS index {version}.")
+
+    def _standalone_question(self, query, session, query_vector):
+        """Rewrites a follow-up into a standalone question; returns (question, its vector)."""
+        messages = session.memory.load_memory_variables({})["chat_history"]
+        question = self._rewrite_locally(query, session, messages)
+        if question is None:
+            inputs = {"question": query, "chat_history": _format_chat_history(messages)}
+            with stage("condense"):
+                question = self.condense_chain.invoke(inputs)
+            _record_llm_tokens("condense", CONDENSE_QUESTION_PROMPT, inputs, question)
+        session.last_question = question
+        annotate(question=question)
+        if question == query:
+            return question, query_vector
+        with stage("question_encode"):
+            return question, self.query_cache.get(question)
+
+    async def _astandalone_question(self, query, session, query_vector):
+        messages = session.memory.load_memory_variables({})["chat_history"]
+        question = self._rewrite_locally(query, session, messages)
+        if question is None:
+            inputs = {"question": query, "chat_history": _format_chat_history(messages)}
+            async with self._llm_slots():
+                with stage("condense"):
+                    question = await self.condense_chain.ainvoke(inputs)
+            _record_llm_tokens("condense", CONDENSE_QUESTION_PROMPT, inputs, question)
+        session.last_question = question
+        annotate(question=question)
+        if question == query:
+            return question, query_vector
+        with stage("question_encode"):
+            if isinstance(self.encoder, BatchingEncoder):
+                return question, await self.query_cache.aget(question)
+            return question, await self._in_executor(self.query_cache.get, question)
+
+    def _rewrite_locally(self, query, session, messages):
+        """The standalone question, or None when only the condense LLM call can produce it."""
+        if not messages:
+            return query
+        previous = session.last_question
+        if previous is None:
+            previous = next((m.content for m in reversed(messages) if m.type == "human"), None)
+        question, _ = self.rewriter.rewrite(query, previous)
+        return question
+
+    def _generate_answer(self, question, question_vector):
+        set_tier("rag")
+        return self._compose_answer(question, question_vector)[0]
+
+    def _compose_answer(self, question, question_vector):
+        """The full RAG pipeline with no caches in front; returns (answer, hits). Used by app.precompute too."""
+        answer, inputs, hits = self._prepare_answer(question, question_vector)
+        if answer is not None:
+            return answer, hits
+        with stage("llm"):
+            answer = self.qa_chain.invoke(inputs)
+        _record_llm_tokens("answer", CUSTOM_PROMPT, inputs, answer)
+        return answer, hits
+
+    def _precomputed_answer(self, question_vector):
+        answer = self.precomputed.lookup(question_vector, self.index_version)
+        if answer is not None:
+            set_tier("precomputed")
+        return answer
+
+    async def _agenerate_answer(self, question, question_vector):
+        set_tier("rag")
+        answer, inputs, _ = await self._in_executor(self._prepare_answer, question, question_vector)
+        if answer is not None:
+            return answer
+        async with self._llm_slots():
+            with stage("llm"):
+                answer = await self.qa_chain.ainvoke(inputs)
+        _record_llm_tokens("answer", CUSTOM_PROMPT, inputs, answer)
+        return answer
+
+    def _prepare_answer(self, question, question_vector):
+        """
+        Everything before the LLM call: retrieval, the extractive fast path and
+        context packing (which encodes sentences). The async paths run it in
+        one executor hop. Returns (extractive answer or None, qa_chain inputs, hits).
+        """
+        hits = self._retrieve(question_vector)
+        answer = self._extractive_answer(question, hits)
+        if answer is not None:
+            return answer, None, hits
+        return None, self._qa_inputs(question, question_vector, hits), hits
+
+    def _retrieve(self, question_vector):
+        """Returns [(document, cosine similarity)], best first."""
+        with stage("retrieval"):
+            hits = self.db.similarity_search_with_score_by_vector(question_vector, k=self.retrieval_k)
+        return [(doc, l2_to_cosine(distance)) for doc, distance in hits]
+
+    def _extractive_answer(self, question, hits):
+        if not self.extractive.enabled:
+            return None
+        with stage("extractive"):
+            answer = self.extractive.answer(question, hits)
+        if answer is not None:
+            set_tier("extractive")
+        return answer
+
+    def _qa_inputs(self, question, question_vector, hits):
+        docs = [doc for doc, _ in hits]
+        if not self.context_packer.enabled:
+            return {"context": "\n\n".join(doc.page_content for doc in docs), "question": question}
+        with stage("context_pack"):
+            context = self.context_packer.pack(question_vector, docs)
+        return {"context": context, "question": question}
+
+    def _in_executor(self, fn, *args):
+        # run_in_executor doesn't carry contextvars over; copy them so stage timings reach the request's trace.
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self.executor, contextvars.copy_context().run, fn, *args)
+
+    def _llm_slots(self):
+        # Created lazily so the semaphore belongs to the running event loop.
+        if self._llm_semaphore is None:
+            self._llm_semaphore = asyncio.Semaphore(self.max_llm_calls)
+        return self._llm_semaphore
+
     # --- MODIFIED: The main "router" now understands expense claims ---
-    def get_answer(self, query):
-        global conversation_state
+    def _route(self, query, session):
+        """Answers from the task flows or employee data; returns None when the FAQ/RAG tiers are needed."""
+        conversation_state = session.state
+        session_id = session.session_id
 
         # Priority 1: Handle an ongoing task
         current_task = conversation_state.get("task")
         if current_task == "apply_leave":
-            return self.handle_leave_application(query)
+            return self.handle_leave_application(query, session_id)
         if current_task == "apply_expense":
-            return self.handle_expense_claim(query)
+            return self.handle_expense_claim(query, session_id)
         if current_task in ["awaiting_id_for_leave", "awaiting_id_for_expense"]:
-            employee_data = get_employee_data(query)
+            with stage("employee_lookup"):
+                employee_data = self.directory.get(query)
             if employee_data:
                 conversation_state["employee_data"] = employee_data
                 employee_name = employee_data.get("full_name", "Employee")
@@ -263,10 +554,14 @@ class ChatbotCore:
                 return "I couldn't find that Employee ID. Please try again or ask a general policy question."
 
         # Priority 2: Check for new task intents
-        action_words = ["file", "claim", "submit", "add", "new"]
-        topic_words_expense = ["expense", "reimbursement"]
-
-        if any(word in query.lower() for word in action_words) and any(word in query.lower() for word in topic_words_expense):
+        message = self.router.match(query)
+        if not message.intents and self.router.classifier_enabled:
+            # Cached, so the FAQ tier reuses this embedding.
+            intent = self.router.classify(self.query_cache.get(query))
+            if intent in ("file_expense", "apply_leave"):
+                message.intents.append(intent)
+
+        if message.has("file_expense"):
             if "employee_data" not in conversation_state:
                 conversation_state["task"] = "awaiting_id_for_expense"
                 return "To file an expense, I first need your Employee ID please."
@@ -275,7 +570,7 @@ class ChatbotCore:
                 conversation_state["expense_type"], conversation_state["amount"], conversation_state["date"], conversation_state["receipt_path"], conversation_state["confirmed"] = None, None, None, None, False
                 return "I can help with that. What category does this expense fall under? (e.g., Travel, Meals, Software)"
 
-        if "apply" in query.lower() and "leave" in query.lower():
+        if message.has("apply_leave"):
             if "employee_data" in conversation_state:
                 employee_data = conversation_state["employee_data"]
                 employee_name = employee_data.get("full_name", "Employee")
@@ -289,26 +584,20 @@ class ChatbotCore:
 
         # Priority 3: Handle direct login or personal queries
         if "employee_data" not in conversation_state:
-            employee_data = get_employee_data(query)
+            with stage("employee_lookup"):
+                employee_data = self.directory.get(query)
             if employee_data:
                 conversation_state["employee_data"] = employee_data
                 return f"Welcome, {employee_data['full_name']}! How can I help you today?"
 
         if "employee_data" in conversation_state:
             employee_data = conversation_state["employee_data"]
-            query_lower = query.lower()
-            if "my name" in query_lower:
+            if message.has("ask_name"):
                 return f"Your name on record is {employee_data.get('full_name', 'not found')}."
-            if "my id" in query_lower or "my employee id" in query_lower:
+            if message.has("ask_id"):
                 return f"Your Employee ID is {employee_data.get('employee_id', 'not found')}."
-            if "my leave" in query_lower or "how many leave" in query_lower:
+            if message.has("ask_leave_balance"):
                 annual, sick = employee_data.get('annual_leave', 'N/A'), employee_data.get('sick_leave', 'N/A')
                 return f"You have {annual} Annual and {sick} Sick leave days remaining."
 
-        # Priority 4: Fallback to Manual FAQ and RAG
-        manual_answer = self._get_manual_answer(query)
-        if manual_answer:
-            return manual_answer
-        
-        result = self.qa_chain.invoke({"question": query})
-        return result['answer']
\ No newline at end of file
+        return None
@@ -0,0 +1,122 @@
+# In app/directory.py
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+# --- In-memory employee directory ---
+class EmployeeDirectory:
+    """
+    employees.json loaded once into a dict keyed by lower-cased employee_id.
+    The file's mtime is checked at most every `check_interval` seconds and a
+    changed file is parsed into a fresh dict that replaces the old one in a
+    single assignment, so lookups never see a half-loaded directory.
+    """
+
+    def __init__(self, path="data/employees.json", check_interval=None):
+        self.path = path
+        self.check_interval = check_interval if check_interval is not None else float(os.getenv("EMPLOYEE_DIRECTORY_CHECK_SECONDS", "5"))
+        self._employees = {}
+        self._mtime = None
+        self._next_check = 0.0
+        self._reload_lock = threading.Lock()
+        self._reload_if_changed()
+
+    def get(self, employee_id):
+        self._maybe_reload()
+        return self._employees.get(employee_id.strip().lower())
+
+    def __len__(self):
+        return len(self._employees)
+
+    def _maybe_reload(self):
+        if time.monotonic() >= self._next_check:
+            self._reload_if_changed()
+
+    def _reload_if_changed(self):
+        with self._reload_lock:
+            self._next_check = time.monotonic() + self.check_interval
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+                if mtime == self._mtime:
+                    return
+                with open(self.path, 'r') as f:
+                    employees = json.load(f)
+                self._employees = {emp["employee_id"].lower(): emp for emp in employees}
+                self._mtime = mtime
+                print(f"✅ Employee directory loaded: {len(self._employees)} employees.")
+            except Exception as e:
+                # Keep serving the last good copy if the new file is missing or half-written.
+                print(f"Error reading employee data: {e}")
+
+# --- SQLite-backed directory for large HR exports ---
+class SqliteEmployeeDirectory:
+    """
+    Same interface as EmployeeDirectory, but lookups go to an indexed SQLite
+    table instead of a dict, so tens of thousands of employees cost no RAM.
+    When `json_path` is given, the database is rebuilt from it whenever the
+    JSON file changes; the new database is written next to the old one and
+    swapped in with os.replace.
+    """
+
+    def __init__(self, db_path="data/employees.sqlite", json_path=None, check_interval=None):
+        self.db_path = db_path
+        self.json_path = json_path
+        self.check_interval = check_interval if check_interval is not None else float(os.getenv("EMPLOYEE_DIRECTORY_CHECK_SECONDS", "5"))
+        self._mtime = None
+        self._next_check = 0.0
+        self._reload_lock = threading.Lock()
+        if json_path:
+            self._rebuild_if_changed()
+
+    def get(self, employee_id):
+        if self.json_path and time.monotonic() >= self._next_check:
+            self._rebuild_if_changed()
+        try:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+            try:
+                row = conn.execute(
+                    "SELECT data FROM employees WHERE employee_id = ?", (employee_id.strip(),)
+                ).fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Error reading employee data: {e}")
+            return None
+        return json.loads(row[0]) if row else None
+
+    def _rebuild_if_changed(self):
+        with self._reload_lock:
+            self._next_check = time.monotonic() + self.check_interval
+            try:
+                mtime = os.stat(self.json_path).st_mtime_ns
+                if mtime == self._mtime and os.path.exists(self.db_path):
+                    return
+                with open(self.json_path, 'r') as f:
+                    employees = json.load(f)
+                tmp_path = f"{self.db_path}.tmp"
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                with sqlite3.connect(tmp_path) as conn:
+                    conn.execute("CREATE TABLE employees (employee_id TEXT PRIMARY KEY COLLATE NOCASE, data TEXT NOT NULL)")
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO employees VALUES (?, ?)",
+                        ((emp["employee_id"], json.dumps(emp)) for emp in employees),
+                    )
+                conn.close()
+                os.replace(tmp_path, self.db_path)
+                self._mtime = mtime
+                print(f"✅ Employee directory database rebuilt: {len(employees)} employees.")
+            except Exception as e:
+                print(f"Error rebuilding employee database: {e}")
+
+def load_employee_directory():
+    """Picks the directory backend from EMPLOYEE_DIRECTORY_BACKEND ("json" or "sqlite")."""
+    json_path = os.getenv("EMPLOYEE_DIRECTORY_PATH", "data/employees.json")
+    if os.getenv("EMPLOYEE_DIRECTORY_BACKEND", "json").lower() == "sqlite":
+        db_path = os.getenv("EMPLOYEE_DIRECTORY_DB", "data/employees.sqlite")
+        # With no JSON export around, serve the database as it is.
+        return SqliteEmployeeDirectory(db_path, json_path if os.path.exists(json_path) else None)
+    return EmployeeDirectory(json_path)
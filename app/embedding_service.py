@@ -0,0 +1,253 @@
+# In app/embedding_service.py
+"""
+One process that owns the MiniLM weights and the FAISS index for every
+uvicorn worker on the box.
+
+    python -m app.embedding_service --socket /tmp/policy-embeddings.sock
+    EMBEDDING_SERVICE_SOCKET=/tmp/policy-embeddings.sock uvicorn app.main:app --workers 8
+
+Workers started with EMBEDDING_SERVICE_SOCKET use RemoteEncoder and
+RemoteIndex instead of loading torch and the index themselves. Encode
+requests that arrive within a couple of milliseconds of each other, from any
+worker, are run through the model as one batch.
+
+Wire format, both directions: an 8-byte header (JSON length, payload length,
+big-endian uint32), a JSON object, then an optional raw float32 payload.
+"""
+
+import os
+import json
+import time
+import socket
+import struct
+import asyncio
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from .embeddings import BatchingEncoder, SharedEncoder
+from .index_store import get_index_version, load_index, read_manifest
+
+DEFAULT_SOCKET = "/tmp/policy-embeddings.sock"
+_FRAME = struct.Struct("!II")
+
+# --- Framing ---
+def _pack(header, payload=b""):
+    body = json.dumps(header).encode("utf-8")
+    return _FRAME.pack(len(body), len(payload)) + body + payload
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise ConnectionError("Embedding service closed the connection.")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+def _vectors_payload(vectors):
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    return {"shape": list(vectors.shape)}, vectors.tobytes()
+
+def _vectors_from(header, payload):
+    return np.frombuffer(payload, dtype=np.float32).reshape(header["shape"])
+
+# --- Client side (in each uvicorn worker) ---
+class EmbeddingServiceClient:
+    """Blocking request/response over the Unix socket, one connection per calling thread."""
+
+    def __init__(self, socket_path=None, timeout=None):
+        self.socket_path = socket_path or os.getenv("EMBEDDING_SERVICE_SOCKET", DEFAULT_SOCKET)
+        self.timeout = timeout or float(os.getenv("EMBEDDING_SERVICE_TIMEOUT_SECONDS", "30"))
+        self._local = threading.local()
+
+    def request(self, header, payload=b""):
+        try:
+            return self._roundtrip(header, payload)
+        except ConnectionError:
+            # The service restarted since this thread last used it; reconnect once.
+            return self._roundtrip(header, payload)
+
+    def _roundtrip(self, header, payload):
+        sock = self._connection()
+        try:
+            sock.sendall(_pack(header, payload))
+            header_size, payload_size = _FRAME.unpack(_recv_exactly(sock, _FRAME.size))
+            response = json.loads(_recv_exactly(sock, header_size))
+            response_payload = _recv_exactly(sock, payload_size) if payload_size else b""
+        except BaseException:
+            # After a timeout or a partial read the rest of this reply is still on its way,
+            # and the next request on the connection would read it as its own.
+            self._close()
+            raise
+        if "error" in response:
+            raise RuntimeError(f"Embedding service error: {response['error']}")
+        return response, response_payload
+
+    def _connection(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._local.sock = sock
+        return sock
+
+    def _close(self):
+        sock = getattr(self._local, "sock", None)
+        self._local.sock = None
+        if sock is not None:
+            sock.close()
+
+class RemoteEncoder(Embeddings):
+    """SharedEncoder's interface, answered by the embedding service."""
+
+    def __init__(self, client):
+        self.client = client
+        info, _ = client.request({"op": "info"})
+        self.model_name = info["model"]
+
+    def encode(self, texts, batch_size=32):
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        response, payload = self.client.request({"op": "encode", "texts": texts})
+        return _vectors_from(response, payload)
+
+    def encode_query(self, text):
+        return self.encode([text])[0]
+
+    def embed_documents(self, texts):
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text):
+        return self.encode_query(text).tolist()
+
+class RemoteIndex:
+    """The part of LangChain's FAISS store ChatbotCore uses, searched in the embedding service."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def similarity_search_by_vector(self, embedding, k=4):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4):
+        header, payload = _vectors_payload(np.asarray(embedding, dtype=np.float32).reshape(1, -1))
+        response, _ = self.client.request({"op": "search", "k": k, **header}, payload)
+        return [(Document(page_content=d["page_content"], metadata=d["metadata"]), d["score"]) for d in response["documents"]]
+
+    def index_version(self):
+        info, _ = self.client.request({"op": "info"})
+        return info["index_version"]
+
+# --- Server side ---
+class EmbeddingService:
+    def __init__(self, faiss_path, max_batch=64, max_wait=0.002, search_threads=4):
+        self.faiss_path = faiss_path
+        self.encoder = SharedEncoder()
+        self.db = load_index(faiss_path, self.encoder)
+        self.index_version = get_index_version(faiss_path)
+        # Same micro-batcher the app uses in-process; its one scheduler thread is the only one running the model.
+        self.batcher = BatchingEncoder(self.encoder, max_batch, max_wait)
+        self.search_pool = ThreadPoolExecutor(max_workers=search_threads, thread_name_prefix="search")
+        self.index_check_interval = float(os.getenv("INDEX_CHECK_SECONDS", "30"))
+        self._next_index_check = time.monotonic() + self.index_check_interval
+        self._reload_task = None
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    header_size, payload_size = _FRAME.unpack(await reader.readexactly(_FRAME.size))
+                except asyncio.IncompleteReadError:
+                    return  # worker closed its connection
+                header = json.loads(await reader.readexactly(header_size))
+                payload = await reader.readexactly(payload_size) if payload_size else b""
+                try:
+                    response, response_payload = await self.dispatch(header, payload)
+                except Exception as e:
+                    response, response_payload = {"error": str(e)}, b""
+                writer.write(_pack(response, response_payload))
+                await writer.drain()
+        except (ConnectionResetError, BrokenPipeError):
+            pass  # the worker timed out on this request and dropped the connection
+        finally:
+            writer.close()
+
+    async def dispatch(self, header, payload):
+        op = header.get("op")
+        if op == "encode":
+            response, vectors = _vectors_payload(await self.batcher.aencode(header["texts"]))
+            return response, vectors
+        if op == "search":
+            self._maybe_reload_index()
+            vector = _vectors_from(header, payload)[0]
+            loop = asyncio.get_running_loop()
+            hits = await loop.run_in_executor(self.search_pool, self.db.similarity_search_with_score_by_vector, vector, header.get("k", 4))
+            documents = [{"page_content": d.page_content, "metadata": d.metadata, "score": float(score)} for d, score in hits]
+            return {"documents": documents}, b""
+        if op == "info":
+            self._maybe_reload_index()
+            return {"model": self.encoder.model_name, "index_version": self.index_version, "batches": self.batcher.batches}, b""
+        raise ValueError(f"Unknown op {op!r}")
+
+    def _maybe_reload_index(self):
+        """
+        Same rule as ChatbotCore: swap in a republished index once manifest and
+        files agree. Loading and hashing run on the search pool; requests keep
+        using the current index until the new one is ready.
+        """
+        if time.monotonic() < self._next_index_check or self._reload_task is not None:
+            return
+        self._next_index_check = time.monotonic() + self.index_check_interval
+        self._reload_task = asyncio.get_running_loop().create_task(self._reload_index())
+
+    async def _reload_index(self):
+        try:
+            loaded = await asyncio.get_running_loop().run_in_executor(self.search_pool, self._load_published_index)
+        finally:
+            self._reload_task = None
+        if loaded is not None:
+            self.db, self.index_version = loaded
+            print(f"✅ Reloaded FAISS index {self.index_version}.")
+
+    def _load_published_index(self):
+        manifest = read_manifest(self.faiss_path)
+        if not manifest or manifest.get("index_version") == self.index_version:
+            return None
+        try:
+            db = load_index(self.faiss_path, self.encoder)
+            version = get_index_version(self.faiss_path)
+        except Exception as e:
+            print(f"Error reloading FAISS index: {e}")
+            return None
+        return (db, version) if version == manifest["index_version"] else None
+
+async def serve(socket_path, service):
+    if os.path.exists(socket_path):
+        os.remove(socket_path)  # left behind by a previous run
+    server = await asyncio.start_unix_server(service.handle, path=socket_path)
+    os.chmod(socket_path, 0o660)
+    print(f"✅ Embedding service listening on {socket_path} (index {service.index_version}).")
+    async with server:
+        await server.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.embedding_service", description="Shared MiniLM + FAISS service for uvicorn workers.")
+    parser.add_argument("--socket", default=os.getenv("EMBEDDING_SERVICE_SOCKET", DEFAULT_SOCKET))
+    parser.add_argument("--index", default="data/mpc_faiss_index", help="FAISS index directory")
+    parser.add_argument("--max-batch", type=int, default=64, help="texts per model batch")
+    parser.add_argument("--max-wait-ms", type=float, default=2.0, help="how long a request waits for others to batch with")
+    parser.add_argument("--search-threads", type=int, default=4)
+    args = parser.parse_args(argv)
+    load_dotenv()  # INDEX_* search settings, as the app reads them
+    service = EmbeddingService(args.index, args.max_batch, args.max_wait_ms / 1000, args.search_threads)
+    asyncio.run(serve(args.socket, service))
+
+if __name__ == "__main__":
+    main()
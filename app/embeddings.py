@@ -0,0 +1,207 @@
+# In app/embeddings.py
+
+import os
+import re
+import time
+import queue
+import asyncio
+import threading
+from concurrent.futures import Future
+from collections import OrderedDict
+from langchain_core.embeddings import Embeddings
+from .metrics import ENCODE_BATCH_SIZE
+
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+
+# --- One MiniLM instance for FAQ matching and FAISS ---
+class SharedEncoder(Embeddings):
+    """
+    Wraps a single SentenceTransformer so the FAQ matcher and the FAISS store
+    share one copy of the weights. Produces the same vectors as LangChain's
+    SentenceTransformerEmbeddings, which built the index in data/mpc_faiss_index.
+    """
+
+    def __init__(self, model_name=EMBEDDING_MODEL_NAME):
+        # Imported here so processes that use the embedding service never load torch.
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name)
+
+    def encode(self, texts, batch_size=32):
+        """Encodes a list of texts into a 2-D float32 numpy array."""
+        texts = [text.replace("\n", " ") for text in texts]
+        return self.model.encode(texts, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
+
+    def encode_query(self, text):
+        """Encodes one text into a 1-D float32 numpy array."""
+        return self.encode([text])[0]
+
+    # LangChain Embeddings interface, used by FAISS.load_local / from_documents
+    def embed_documents(self, texts):
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text):
+        return self.encode_query(text).tolist()
+
+# --- Micro-batching in front of the model ---
+class BatchingEncoder(Embeddings):
+    """
+    Coalesces encode calls from concurrent requests. One scheduler thread
+    takes the first waiting request, keeps collecting for up to `max_wait`
+    seconds or `max_batch` texts, and runs a single forward pass for all of
+    them; on CPU one batch of 16 costs little more than one text.
+
+    encode() blocks the calling thread on the result, so a batch can never
+    be bigger than the number of threads calling it; blocking calls larger
+    than `max_batch` (FAQ and ingest bulk encodes) go straight to the model.
+    aencode() is for the event loop: the coroutine awaits the result without
+    holding a thread, so every request in flight can share one batch. The
+    app's async paths and the embedding service both use it.
+    """
+
+    def __init__(self, encoder, max_batch=None, max_wait=None):
+        self.encoder = encoder
+        self.model_name = encoder.model_name
+        self.max_batch = max_batch or int(os.getenv("ENCODER_MAX_BATCH", "32"))
+        self.max_wait = max_wait if max_wait is not None else float(os.getenv("ENCODER_MAX_WAIT_MS", "2")) / 1000
+        self.batches = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def encode(self, texts, batch_size=32):
+        texts = list(texts)
+        if len(texts) > self.max_batch:
+            return self.encoder.encode(texts, batch_size=batch_size)
+        self._ensure_started()
+        future = Future()
+        self._queue.put((texts, future))
+        return future.result()
+
+    def encode_query(self, text):
+        return self.encode([text])[0]
+
+    async def aencode(self, texts):
+        self._ensure_started()
+        future = Future()
+        self._queue.put((list(texts), future))
+        return await asyncio.wrap_future(future)
+
+    async def aencode_query(self, text):
+        return (await self.aencode([text]))[0]
+
+    def embed_documents(self, texts):
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text):
+        return self.encode_query(text).tolist()
+
+    def _ensure_started(self):
+        # Threads don't survive the fork into a preloaded gunicorn worker; start one per process.
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(target=self._run, daemon=True, name="encode-batcher")
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                size += len(item[0])
+            self._encode_batch(batch)
+
+    def _encode_batch(self, batch):
+        # A cancelled aencode() caller (client went away) no longer needs its vectors.
+        batch = [(texts, future) for texts, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        texts = [text for request_texts, _ in batch for text in request_texts]
+        size = len(texts)
+        ENCODE_BATCH_SIZE.observe(size)
+        self.batches += 1
+        try:
+            vectors = self.encoder.encode(texts, batch_size=max(size, 1))
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        start = 0
+        for request_texts, future in batch:
+            future.set_result(vectors[start:start + len(request_texts)])
+            start += len(request_texts)
+
+# --- LRU cache of query embeddings ---
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+def normalize_query(text):
+    """Folds case, punctuation and whitespace so 'Dress code?' and 'dress  code' share a key."""
+    return " ".join(_PUNCTUATION.sub(" ", text.lower()).split())
+
+class QueryEmbeddingCache:
+    """
+    Bounded LRU map from normalized query text to its embedding. Employees ask
+    the same handful of questions all day, and a hit skips the transformer.
+    """
+
+    def __init__(self, encoder, max_size=None):
+        self.encoder = encoder
+        self.max_size = max_size or int(os.getenv("QUERY_CACHE_SIZE", "2048"))
+        self.hits = 0
+        self.misses = 0
+        self._vectors = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text):
+        """Returns the embedding for `text`, encoding it only on a miss."""
+        key, vector = self._lookup(text)
+        if vector is not None:
+            return vector
+        # Encode outside the lock so a miss doesn't hold up hits on other threads.
+        return self._remember(key, self.encoder.encode_query(text))
+
+    async def aget(self, text):
+        """get() for the event loop; needs an encoder with aencode_query (BatchingEncoder)."""
+        key, vector = self._lookup(text)
+        if vector is not None:
+            return vector
+        return self._remember(key, await self.encoder.aencode_query(text))
+
+    def _lookup(self, text):
+        key = normalize_query(text)
+        with self._lock:
+            vector = self._vectors.get(key)
+            if vector is not None:
+                self._vectors.move_to_end(key)
+                self.hits += 1
+                return key, vector
+            self.misses += 1
+        return key, None
+
+    def _remember(self, key, vector):
+        vector.flags.writeable = False
+        with self._lock:
+            self._vectors[key] = vector
+            self._vectors.move_to_end(key)
+            while len(self._vectors) > self.max_size:
+                self._vectors.popitem(last=False)
+        return vector
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._vectors), "hits": self.hits, "misses": self.misses}
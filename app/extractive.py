@@ -0,0 +1,77 @@
+# In app/extractive.py
+
+import os
+import re
+from .condense import STOPWORDS
+from .context import split_sentences
+from .metrics import Counter
+
+EXTRACTIVE = Counter("chatbot_extractive_total", "Policy questions by whether the extractive fast path answered them.", ["result"])
+
+_WORD = re.compile(r"[a-z0-9']+")
+
+# --- Answers quoted straight from the top chunk ---
+class ExtractiveAnswerer:
+    """
+    When the top FAISS hit is close enough to the question, answers with the
+    chunk's most relevant sentences as bullet points instead of waiting for the
+    LLM to reword them. Sentences are ranked by how many of the question's
+    content words they share; a chunk with no overlap at all goes to the LLM.
+    EXTRACTIVE_ANSWERS=1 turns it on.
+    """
+
+    def __init__(self, enabled=None, threshold=None, max_sentences=None):
+        self.enabled = enabled if enabled is not None else os.getenv("EXTRACTIVE_ANSWERS", "0") == "1"
+        self.threshold = threshold if threshold is not None else float(os.getenv("EXTRACTIVE_THRESHOLD", "0.7"))
+        self.max_sentences = max_sentences or int(os.getenv("EXTRACTIVE_MAX_SENTENCES", "3"))
+        self.counts = {"answered": 0, "below_threshold": 0, "no_overlap": 0}
+
+    def answer(self, question, hits):
+        """`hits` are (document, cosine similarity) pairs, best first. Returns the answer, or None for the LLM."""
+        if not self.enabled or not hits:
+            return None
+        doc, similarity = hits[0]
+        if similarity < self.threshold:
+            return self._count("below_threshold")
+        sentences = self._best_sentences(question, doc.page_content)
+        if not sentences:
+            return self._count("no_overlap")
+        self._count("answered")
+        bullets = "\n".join(f"* {sentence}" for sentence in sentences)
+        return f"{bullets}\n\n(Source: {_source(doc.metadata)})"
+
+    def _best_sentences(self, question, text):
+        terms = {_stem(w) for w in _WORD.findall(question.lower()) if w not in STOPWORDS}
+        sentences = split_sentences(text)
+        scored = []
+        for position, sentence in enumerate(sentences):
+            if len(sentence) < 15:
+                continue  # headings, page numbers and stray fragments
+            overlap = len(terms & {_stem(w) for w in _WORD.findall(sentence.lower())})
+            if overlap:
+                scored.append((overlap, position, sentence))
+        best = sorted(scored, key=lambda item: (-item[0], item[1]))[:self.max_sentences]
+        # Back in document order, so the bullets read the way the policy does.
+        return [sentence for _, _, sentence in sorted(best, key=lambda item: item[1])]
+
+    def _count(self, result):
+        self.counts[result] += 1
+        EXTRACTIVE.inc(result=result)
+        return None
+
+def l2_to_cosine(distance):
+    # FAISS returns squared L2 distances; for MiniLM's unit-length vectors that is 2 - 2*cos.
+    return 1.0 - float(distance) / 2.0
+
+def _stem(word):
+    # Crude, but enough to let "timings" match "timing" and "holidays" match "holiday".
+    for suffix in ("ing", "es", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[: -len(suffix)]
+    return word
+
+def _source(metadata):
+    name = os.path.basename(str(metadata.get("source", "the policy book")))
+    page = metadata.get("page")
+    # PyMuPDF pages are 0-based; readers count from 1.
+    return f"{name}, page {int(page) + 1}" if isinstance(page, int) else name
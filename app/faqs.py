@@ -0,0 +1,148 @@
+# In app/faqs.py
+
+import os
+import json
+import time
+import hashlib
+import threading
+import numpy as np
+
+# --- FAQ matcher ---
+class FaqMatcher:
+    """
+    faqs.json held as a matrix of unit-length question embeddings, so matching
+    a query is one matrix-vector product. Like the employee directory, the file
+    is re-read when its mtime changes and the new FAQ set replaces the old one
+    in a single assignment. Embeddings are kept in `cache_path` keyed by a hash
+    of the question text, so a restart or an edit to faqs.json only encodes
+    the questions that were added or reworded.
+    """
+
+    def __init__(self, encoder, path="data/faqs.json", cache_path=None, check_interval=None, threshold=None, margin=None):
+        self.encoder = encoder
+        self.path = path
+        self.cache_path = cache_path if cache_path is not None else os.getenv("FAQ_EMBEDDINGS_PATH", "data/faq_embeddings.npz")
+        self.check_interval = check_interval if check_interval is not None else float(os.getenv("FAQ_CHECK_SECONDS", "5"))
+        self.threshold = threshold if threshold is not None else float(os.getenv("FAQ_THRESHOLD", "0.75"))
+        # How far the best match must beat the runner-up with a different answer; 0 turns the check off.
+        self.margin = margin if margin is not None else float(os.getenv("FAQ_MARGIN", "0"))
+        self._faqs = ([], [], np.zeros((0, 0), dtype=np.float32))  # questions, answers, matrix
+        self._mtime = None
+        self._next_check = 0.0
+        self._reload_lock = threading.Lock()
+        self._reload_if_changed()
+
+    def __len__(self):
+        return len(self._faqs[0])
+
+    def match(self, query_vector):
+        """The answer for the closest FAQ, or None when no question is close (or clear-cut) enough."""
+        return self.match_many(np.asarray(query_vector, dtype=np.float32).reshape(1, -1))[0]
+
+    def match_many(self, query_vectors):
+        """match() for a batch of query vectors (one per row)."""
+        self._maybe_reload()
+        questions, answers, matrix = self._faqs
+        if not questions:
+            return [None] * len(query_vectors)
+        scores, indices = _top_k(query_vectors, matrix, k=2)
+        results = []
+        for row_scores, row_indices in zip(scores, indices):
+            best = row_indices[0]
+            if row_scores[0] < self.threshold:
+                results.append(None)
+            elif self.margin and len(row_indices) > 1 and answers[row_indices[1]] != answers[best] \
+                    and row_scores[0] - row_scores[1] < self.margin:
+                results.append(None)  # two different answers fit about equally well; let RAG decide
+            else:
+                results.append(answers[best])
+        return results
+
+    def top_k(self, query_vectors, k=5):
+        """The k closest FAQs per query as (scores, questions), best first."""
+        questions, _, matrix = self._faqs
+        if not questions:
+            return [], []
+        scores, indices = _top_k(query_vectors, matrix, k)
+        return scores, [[questions[i] for i in row] for row in indices]
+
+    # --- Reloading ---
+    def _maybe_reload(self):
+        if time.monotonic() >= self._next_check:
+            self._reload_if_changed()
+
+    def _reload_if_changed(self):
+        with self._reload_lock:
+            self._next_check = time.monotonic() + self.check_interval
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+                if mtime == self._mtime:
+                    return
+                with open(self.path, 'r') as f:
+                    faqs = json.load(f)
+                questions = list(faqs.keys())
+                matrix, encoded = self._embed(questions)
+                self._faqs = (questions, [faqs[q] for q in questions], matrix)
+                self._mtime = mtime
+                print(f"✅ Manual FAQs loaded: {len(questions)} questions ({encoded} newly encoded).")
+            except Exception as e:
+                # Keep answering from the last good copy if the new file is missing or half-written.
+                print(f"Error loading FAQs from {self.path}: {e}")
+
+    def _embed(self, questions):
+        """Unit-length embeddings for `questions`, encoding only those missing from the cache file."""
+        cached = self._load_cache()
+        keys = [_question_key(q) for q in questions]
+        missing = [q for q, key in zip(questions, keys) if key not in cached]
+        if missing:
+            vectors = np.asarray(self.encoder.encode(missing), dtype=np.float32)
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            cached.update(zip((_question_key(q) for q in missing), vectors))
+        if not questions:
+            return np.zeros((0, 0), dtype=np.float32), 0
+        matrix = np.stack([cached[key] for key in keys]).astype(np.float32)
+        if missing or len(cached) != len(keys):
+            self._save_cache(keys, matrix)
+        return matrix, len(missing)
+
+    def _load_cache(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with np.load(self.cache_path) as data:
+                if str(data["model"]) != getattr(self.encoder, "model_name", ""):
+                    return {}  # encoded by a different model
+                return dict(zip(data["keys"].tolist(), data["vectors"]))
+        except Exception as e:
+            print(f"Ignoring unreadable FAQ embedding cache {self.cache_path}: {e}")
+            return {}
+
+    def _save_cache(self, keys, matrix):
+        """Writes only the current questions, so reworded ones don't pile up."""
+        if not self.cache_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+            tmp_path = f"{self.cache_path}.tmp-{os.getpid()}.npz"
+            np.savez(tmp_path, model=np.array(getattr(self.encoder, "model_name", "")), keys=np.array(keys), vectors=matrix)
+            os.replace(tmp_path, self.cache_path)
+        except Exception as e:
+            print(f"Could not save FAQ embeddings to {self.cache_path}: {e}")
+
+def _top_k(query_vectors, matrix, k):
+    """Cosine scores and row indices of the k best rows of `matrix` per query, each shaped (queries, k)."""
+    queries = np.asarray(query_vectors, dtype=np.float32).reshape(-1, matrix.shape[1])
+    queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+    scores = queries @ matrix.T
+    k = min(k, len(matrix))
+    if k < len(matrix):
+        # argpartition finds the top k without sorting every FAQ.
+        indices = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        indices = np.broadcast_to(np.arange(len(matrix)), scores.shape)
+    top = np.take_along_axis(scores, indices, axis=1)
+    order = np.argsort(-top, axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(indices, order, axis=1)
+
+def _question_key(question):
+    return hashlib.sha1(question.encode("utf-8")).hexdigest()
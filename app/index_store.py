@@ -0,0 +1,188 @@
+# In app/index_store.py
+
+import os
+import json
+import sqlite3
+import hashlib
+import weakref
+import threading
+from collections.abc import Mapping
+import faiss
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+LEGACY_INDEX_FILES = ("index.faiss", "index.pkl")
+DOCSTORE_FILE = "docstore.sqlite"
+INDEX_FILES = ("index.faiss", DOCSTORE_FILE)
+MANIFEST_FILE = "manifest.json"
+INDEX_TYPES = ("flat", "hnsw", "ivfpq")
+
+# --- Building FAISS indexes ---
+def build_faiss_index(vectors, index_type="flat", hnsw_m=32, hnsw_ef_construction=200,
+                      ivf_nlist=1024, pq_m=48, pq_nbits=8):
+    """
+    Builds an L2 index over `vectors`:
+      flat  - exact search, what the Colab prototype produced
+      hnsw  - graph index, sub-linear search with no training step
+      ivfpq - inverted lists over product-quantized codes; smallest in RAM,
+              for indexes covering every department's policy documents
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    count, dim = vectors.shape
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m)
+        index.hnsw.efConstruction = hnsw_ef_construction
+    elif index_type == "ivfpq":
+        if dim % pq_m:
+            raise ValueError(f"pq_m={pq_m} must divide the embedding size {dim}.")
+        # k-means needs ~39 points per centroid and PQ needs 2**nbits points per sub-quantizer,
+        # so small corpora get fewer lists and shorter codes instead of a training error.
+        nlist = max(1, min(ivf_nlist, count // 39))
+        nbits = max(1, min(pq_nbits, int(np.log2(max(count, 2)))))
+        index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dim), dim, nlist, pq_m, nbits)
+        index.train(vectors)
+    else:
+        raise ValueError(f"Unknown index type {index_type!r}; expected one of {INDEX_TYPES}.")
+    index.add(vectors)
+    return index
+
+def write_docstore(path, documents):
+    """Writes documents to SQLite, row i holding the document for FAISS position i."""
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE docs (position INTEGER PRIMARY KEY, page_content TEXT NOT NULL, metadata TEXT NOT NULL)")
+        conn.executemany(
+            "INSERT INTO docs VALUES (?, ?, ?)",
+            ((i, doc.page_content, json.dumps(doc.metadata)) for i, doc in enumerate(documents)),
+        )
+    conn.close()
+
+# --- Pickle-free docstore ---
+class SqliteDocstore(Docstore):
+    """
+    Reads chunks from docstore.sqlite on demand instead of unpickling the whole
+    docstore into every process; the OS page cache is shared between workers.
+
+    The file is opened once, when the index is loaded, and every thread reads
+    through that connection. app.ingest replaces docstore.sqlite under a
+    running server, and a connection opened by path later would read the new
+    chunks at the old index's FAISS positions. The connection is closed when
+    the index holding it is dropped after a reload.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        weakref.finalize(self, self._connection.close)
+
+    def search(self, search):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT page_content, metadata FROM docs WHERE position = ?", (int(search),)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(page_content=row[0], metadata=json.loads(row[1]))
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+class _PositionIds(Mapping):
+    """index_to_docstore_id for SqliteDocstore: FAISS position i is docstore id i."""
+
+    def __init__(self, size):
+        self.size = size
+
+    def __getitem__(self, position):
+        if not 0 <= position < self.size:
+            raise KeyError(position)
+        return int(position)
+
+    def __iter__(self):
+        return iter(range(self.size))
+
+    def __len__(self):
+        return self.size
+
+# --- Loading ---
+def load_index(faiss_path, embeddings, mmap=None):
+    """
+    Loads an index written by app.ingest (index.faiss + docstore.sqlite). With
+    `mmap` (INDEX_MMAP, on by default) the FAISS file is memory-mapped, so
+    workers share its pages and start without reading it all into RAM.
+    Indexes saved by LangChain's save_local (index.faiss + index.pkl) still load
+    through the pickle path.
+    """
+    if not os.path.exists(os.path.join(faiss_path, DOCSTORE_FILE)):
+        return FAISS.load_local(faiss_path, embeddings, allow_dangerous_deserialization=True)
+
+    manifest = read_manifest(faiss_path) or {}
+    if mmap is None:
+        mmap = os.getenv("INDEX_MMAP", "1") != "0"
+    flags = faiss.IO_FLAG_READ_ONLY
+    if mmap:
+        # IVF maps its inverted lists; flat and HNSW map their flat code storage
+        # (IO_FLAG_MMAP_IFC, faiss >= 1.8). The two flags don't combine for IVF.
+        if manifest.get("index_type") == "ivfpq":
+            flags |= faiss.IO_FLAG_MMAP
+        else:
+            flags |= getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    index = faiss.read_index(os.path.join(faiss_path, "index.faiss"), flags)
+    apply_search_params(index, manifest)
+    return FAISS(embeddings, index, SqliteDocstore(os.path.join(faiss_path, DOCSTORE_FILE)), _PositionIds(index.ntotal))
+
+def apply_search_params(index, manifest):
+    """Search-time knobs: the build's defaults from the manifest, overridable from .env."""
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = int(os.getenv("INDEX_HNSW_EF_SEARCH", manifest.get("hnsw_ef_search", 64)))
+    elif isinstance(index, faiss.IndexIVF):
+        index.nprobe = int(os.getenv("INDEX_IVF_NPROBE", manifest.get("ivf_nprobe", 16)))
+
+def _index_files(faiss_path):
+    if os.path.exists(os.path.join(faiss_path, DOCSTORE_FILE)):
+        return INDEX_FILES
+    return LEGACY_INDEX_FILES
+
+def get_index_version(faiss_path):
+    """Content hash of the FAISS index files; changes whenever the index is rebuilt."""
+    digest = hashlib.sha1()
+    for name in _index_files(faiss_path):
+        with open(os.path.join(faiss_path, name), 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()[:16]
+
+def read_manifest(faiss_path):
+    """The manifest app.ingest writes last; None for an index built some other way."""
+    try:
+        with open(os.path.join(faiss_path, MANIFEST_FILE), 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+# --- Saving ---
+def publish_index(build_path, faiss_path, manifest, extra_files=()):
+    """
+    Moves a freshly written index from `build_path` into `faiss_path`.
+    Each file is swapped in with os.replace and the manifest goes last, so a
+    reader that sees the new manifest version and a matching
+    get_index_version() knows it has loaded a complete index.
+    """
+    os.makedirs(faiss_path, exist_ok=True)
+    manifest = {**manifest, "index_version": get_index_version(build_path)}
+    for name in (*_index_files(build_path), *extra_files):
+        os.replace(os.path.join(build_path, name), os.path.join(faiss_path, name))
+    tmp_manifest = os.path.join(faiss_path, f"{MANIFEST_FILE}.tmp")
+    with open(tmp_manifest, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_manifest, os.path.join(faiss_path, MANIFEST_FILE))
+    # A pickle left over from a LangChain-format index would only confuse the next reader.
+    legacy_pickle = os.path.join(faiss_path, "index.pkl")
+    if os.path.exists(legacy_pickle) and os.path.exists(os.path.join(faiss_path, DOCSTORE_FILE)):
+        os.remove(legacy_pickle)
+    return manifest
@@ -0,0 +1,183 @@
+# In app/ingest.py
+"""
+Builds the policy FAISS index from PDFs.
+
+    python -m app.ingest "data/MPC - Policy Book - V1.5.pdf" --index data/mpc_faiss_index
+
+Pages are extracted in a process pool and chunked the same way the Colab
+prototype did (CharacterTextSplitter, 500/50). Every chunk is hashed, and
+chunks whose text was already embedded by an earlier run are taken from the
+embedding cache kept next to the index, so a new policy-book revision only
+pays for the pages that actually changed.
+
+The index is written as a native FAISS file (flat, HNSW or IVF-PQ, see
+--index-type) plus a SQLite docstore, so loading it needs no pickle and can
+memory-map the index. It is published with index_store.publish_index, which
+a running ChatbotCore picks up.
+"""
+
+import os
+import glob
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import faiss
+import fitz
+from langchain_core.documents import Document
+from langchain_text_splitters import CharacterTextSplitter
+from .embeddings import SharedEncoder
+from .index_store import (
+    DOCSTORE_FILE, INDEX_TYPES, build_faiss_index, publish_index, read_manifest, write_docstore,
+)
+
+EMBEDDING_CACHE_FILE = "embedding_cache.npz"
+PAGES_PER_TASK = 8
+
+# --- PDF parsing (runs in worker processes) ---
+def extract_pages(pdf_path, start, stop):
+    """Returns [(text, metadata)] for pages start..stop-1, with PyMuPDFLoader-style metadata."""
+    pages = []
+    with fitz.open(pdf_path) as doc:
+        base_metadata = {k: v for k, v in doc.metadata.items() if isinstance(v, (str, int))}
+        for page_number in range(start, min(stop, len(doc))):
+            metadata = {
+                **base_metadata,
+                "source": os.path.basename(pdf_path),
+                "file_path": os.path.basename(pdf_path),
+                "page": page_number,
+                "total_pages": len(doc),
+            }
+            pages.append((doc[page_number].get_text(), metadata))
+    return pages
+
+def parse_pdfs(pdf_paths, workers):
+    tasks = []
+    for pdf_path in pdf_paths:
+        with fitz.open(pdf_path) as doc:
+            page_count = len(doc)
+        tasks += [(pdf_path, start, start + PAGES_PER_TASK) for start in range(0, page_count, PAGES_PER_TASK)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(extract_pages, *zip(*tasks)) if tasks else []
+        return [Document(page_content=text, metadata=metadata) for pages in results for text, metadata in pages]
+
+# --- Embedding cache ---
+def _hash_text(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def load_embedding_cache(faiss_path, model_name):
+    path = os.path.join(faiss_path, EMBEDDING_CACHE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with np.load(path) as cache:
+        if str(cache["model"]) != model_name:
+            return {}
+        return dict(zip(cache["hashes"].tolist(), cache["vectors"]))
+
+def save_embedding_cache(build_path, model_name, hashes, vectors):
+    np.savez(
+        os.path.join(build_path, EMBEDDING_CACHE_FILE),
+        model=np.array(model_name), hashes=np.array(hashes), vectors=vectors,
+    )
+
+# --- Build ---
+def build_index(pdf_paths, faiss_path, chunk_size=500, chunk_overlap=50, workers=None, batch_size=256,
+                full=False, index_type="flat", index_params=None, search_params=None):
+    index_params = index_params or {}
+    started = time.perf_counter()
+    pages = parse_pdfs(pdf_paths, workers or os.cpu_count())
+    print(f"Parsed {len(pages)} pages from {len(pdf_paths)} PDF(s).")
+
+    page_hashes = {}
+    for page in pages:
+        page_hashes.setdefault(page.metadata["source"], []).append(_hash_text(page.page_content))
+    previous = read_manifest(faiss_path) or {}
+    old_pages = previous.get("pages", {})
+    changed = sum(
+        1 for source, hashes in page_hashes.items()
+        for i, page_hash in enumerate(hashes)
+        if i >= len(old_pages.get(source, [])) or old_pages[source][i] != page_hash
+    )
+    print(f"{changed} of {len(pages)} pages are new or changed since the last build.")
+
+    splitter = CharacterTextSplitter(
+        separator="\n", chunk_size=chunk_size, chunk_overlap=chunk_overlap, length_function=len
+    )
+    chunks = splitter.split_documents(pages)
+    chunk_hashes = [_hash_text(chunk.page_content) for chunk in chunks]
+
+    encoder = SharedEncoder()
+    cache = {} if full else load_embedding_cache(faiss_path, encoder.model_name)
+    missing = sorted({h: i for i, h in enumerate(chunk_hashes) if h not in cache}.values())
+    print(f"{len(chunks)} chunks; embedding {len(missing)}, reusing {len(chunks) - len(missing)}.")
+    if missing:
+        vectors = encoder.encode([chunks[i].page_content for i in missing], batch_size=batch_size)
+        for i, vector in zip(missing, vectors):
+            cache[chunk_hashes[i]] = vector
+    vectors = np.array([cache[h] for h in chunk_hashes], dtype=np.float32)
+
+    index = build_faiss_index(vectors, index_type, **index_params)
+    parent = os.path.dirname(os.path.abspath(faiss_path))
+    build_path = tempfile.mkdtemp(prefix=".index-build-", dir=parent)
+    try:
+        faiss.write_index(index, os.path.join(build_path, "index.faiss"))
+        write_docstore(os.path.join(build_path, DOCSTORE_FILE), chunks)
+        save_embedding_cache(build_path, encoder.model_name, chunk_hashes, vectors)
+        manifest = publish_index(build_path, faiss_path, {
+            "model": encoder.model_name,
+            "index_type": index_type,
+            **index_params,
+            **(search_params or {}),
+            "chunk_size": chunk_size,
+            "chunk_overlap": chunk_overlap,
+            "chunks": len(chunks),
+            "pages": page_hashes,
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        }, extra_files=(EMBEDDING_CACHE_FILE,))
+    finally:
+        shutil.rmtree(build_path, ignore_errors=True)
+    print(f"✅ Index {manifest['index_version']} written to {faiss_path} in {time.perf_counter() - started:.1f}s.")
+    return manifest
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.ingest", description="Build the policy FAISS index from PDFs.")
+    parser.add_argument("pdfs", nargs="*", help="PDF files to index (default: data/*.pdf)")
+    parser.add_argument("--index", default="data/mpc_faiss_index", help="index directory to write")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=None, help="PDF parsing processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=256, help="chunks per embedding batch")
+    parser.add_argument("--full", action="store_true", help="ignore the embedding cache and re-embed everything")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat")
+    parser.add_argument("--hnsw-m", type=int, default=32, help="HNSW graph degree")
+    parser.add_argument("--hnsw-ef-construction", type=int, default=200)
+    parser.add_argument("--hnsw-ef-search", type=int, default=64, help="default search depth (INDEX_HNSW_EF_SEARCH overrides)")
+    parser.add_argument("--ivf-nlist", type=int, default=1024, help="IVF lists (capped for small corpora)")
+    parser.add_argument("--ivf-nprobe", type=int, default=16, help="default lists searched (INDEX_IVF_NPROBE overrides)")
+    parser.add_argument("--pq-m", type=int, default=48, help="PQ sub-quantizers; must divide 384")
+    parser.add_argument("--pq-nbits", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    if args.index_type == "hnsw":
+        index_params = {"hnsw_m": args.hnsw_m, "hnsw_ef_construction": args.hnsw_ef_construction}
+        search_params = {"hnsw_ef_search": args.hnsw_ef_search}
+    elif args.index_type == "ivfpq":
+        index_params = {"ivf_nlist": args.ivf_nlist, "pq_m": args.pq_m, "pq_nbits": args.pq_nbits}
+        search_params = {"ivf_nprobe": args.ivf_nprobe}
+    else:
+        index_params, search_params = {}, {}
+
+    pdf_paths = args.pdfs or sorted(glob.glob("data/*.pdf"))
+    if not pdf_paths:
+        parser.error("no PDFs given and none found in data/")
+    build_index(
+        pdf_paths, args.index, chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap,
+        workers=args.workers, batch_size=args.batch_size, full=args.full,
+        index_type=args.index_type, index_params=index_params, search_params=search_params,
+    )
+
+if __name__ == "__main__":
+    main()
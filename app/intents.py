@@ -0,0 +1,114 @@
+# In app/intents.py
+
+import os
+import re
+import numpy as np
+
+# --- Intent table ---
+# Checked in this order. An intent matches when, for every keyword group in
+# `all_of`, at least one of its keywords appears in the lower-cased message
+# (plain substring match, as the original if-chains did). `examples` feed the
+# optional embedding classifier for messages no keyword matches.
+INTENTS = [
+    {
+        "name": "file_expense",
+        "all_of": [["file", "claim", "submit", "add", "new"], ["expense", "reimbursement"]],
+        "examples": ["I want to get reimbursed for a business trip", "I paid for a client lunch and need the money back"],
+    },
+    {
+        "name": "apply_leave",
+        "all_of": [["apply"], ["leave"]],
+        "examples": ["I need to take a few days off next week", "Can I book time off for my vacation"],
+    },
+    {"name": "ask_name", "all_of": [["my name"]]},
+    {"name": "ask_id", "all_of": [["my id", "my employee id"]]},
+    {"name": "ask_leave_balance", "all_of": [["my leave", "how many leave"]]},
+]
+
+# --- Routed message ---
+class RoutedMessage:
+    """One message after a single lower-case + keyword scan."""
+
+    def __init__(self, text, lower, intents):
+        self.text = text
+        self.lower = lower
+        self.intents = intents
+
+    def has(self, intent):
+        return intent in self.intents
+
+# --- Compiled router ---
+class IntentRouter:
+    """
+    Compiles every keyword in the intent table into one regex that is run
+    once over the lower-cased message. The regex is a lookahead at each
+    position, so overlapping keywords are all found; keywords that are a
+    prefix of a longer match at the same position come from a table built at
+    compile time. Each keyword maps to a bitmask of the (intent, group) pairs
+    it satisfies, and an intent matches when all of its group bits are set.
+
+    With an encoder (INTENT_CLASSIFIER=1), messages that match no keyword are
+    compared against the intents' example phrasings and routed when the best
+    one is at least `threshold` cosine-similar.
+    """
+
+    def __init__(self, intents=None, encoder=None, threshold=None):
+        self.intents = intents or INTENTS
+        self.threshold = threshold or float(os.getenv("INTENT_CLASSIFIER_THRESHOLD", "0.8"))
+        keywords = sorted({kw for intent in self.intents for group in intent["all_of"] for kw in group}, key=len, reverse=True)
+        self._pattern = re.compile("(?=(" + "|".join(re.escape(kw) for kw in keywords) + "))")
+        self._bits = dict.fromkeys(keywords, 0)
+        self._required = []
+        bit = 1
+        for intent in self.intents:
+            required = 0
+            for group in intent["all_of"]:
+                for kw in group:
+                    self._bits[kw] |= bit
+                required |= bit
+                bit <<= 1
+            self._required.append((intent["name"], required))
+        # A match for "my employee id" also counts as a match for any keyword it starts with.
+        self._bits = {kw: _or_all(self._bits[other] for other in keywords if kw.startswith(other)) for kw in keywords}
+
+        self._example_intents = []
+        self._example_matrix = None
+        if encoder is not None:
+            for intent in self.intents:
+                self._example_intents += [intent["name"]] * len(intent.get("examples", []))
+            examples = [example for intent in self.intents for example in intent.get("examples", [])]
+            if examples:
+                self._example_matrix = _unit_rows(np.asarray(encoder.encode(examples), dtype=np.float32))
+
+    @property
+    def classifier_enabled(self):
+        return self._example_matrix is not None
+
+    def match(self, text):
+        lower = text.lower()
+        bits = 0
+        for kw in self._pattern.findall(lower):
+            bits |= self._bits[kw]
+        intents = [name for name, required in self._required if bits & required == required] if bits else []
+        return RoutedMessage(text, lower, intents)
+
+    def classify(self, vector):
+        """Best intent for a message vector by example similarity, or None."""
+        if self._example_matrix is None:
+            return None
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        scores = self._example_matrix @ (vector / norm if norm else vector)
+        best = int(np.argmax(scores))
+        return self._example_intents[best] if scores[best] >= self.threshold else None
+
+def _or_all(values):
+    bits = 0
+    for value in values:
+        bits |= value
+    return bits
+
+def _unit_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
@@ -0,0 +1,222 @@
+# In app/llm_client.py
+
+import os
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any
+import httpx
+import numpy as np
+import openai
+from pydantic import PrivateAttr
+from langchain.chat_models import ChatOpenAI
+from langchain_core.language_models.chat_models import BaseChatModel
+from .metrics import Counter
+
+LLM_ATTEMPTS = Counter("chatbot_llm_attempts_total", "LLM HTTP attempts by outcome (ok, retried, hedged, hedge_won, failed).", ["outcome"])
+
+DEFAULT_BASE_URL = "https://api.together.xyz/v1"
+DEFAULT_MODEL = "mistralai/Mistral-7B-Instruct-v0.2"
+
+# Errors worth another attempt: the request may well succeed a moment later.
+TRANSIENT_ERRORS = (
+    openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError,
+    httpx.TimeoutException, httpx.TransportError,
+)
+
+# --- Pooled HTTP clients ---
+def build_chat_model(api_key, base_url=None, model_name=None):
+    """
+    ChatOpenAI on keep-alive connection pools with explicit connect/read
+    timeouts, wrapped in ResilientChatModel for retries and hedging. The
+    OpenAI SDK's own retries are off so attempts are only counted once.
+    """
+    base_url = base_url or os.getenv("LLM_BASE_URL", DEFAULT_BASE_URL)
+    timeout = httpx.Timeout(
+        float(os.getenv("LLM_READ_TIMEOUT_SECONDS", "30")),
+        connect=float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "5")),
+    )
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "32")),
+        max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE", "16")),
+        keepalive_expiry=float(os.getenv("LLM_KEEPALIVE_SECONDS", "60")),
+    )
+    client_options = {"api_key": api_key, "base_url": base_url, "timeout": timeout, "max_retries": 0}
+    sync_client = openai.OpenAI(http_client=httpx.Client(timeout=timeout, limits=limits), **client_options)
+    async_client = openai.AsyncOpenAI(http_client=httpx.AsyncClient(timeout=timeout, limits=limits), **client_options)
+    chat_model = ChatOpenAI(
+        openai_api_key=api_key, model_name=model_name or os.getenv("LLM_MODEL", DEFAULT_MODEL),
+        base_url=base_url, temperature=0.2, max_tokens=512, max_retries=0,
+        client=sync_client.chat.completions, async_client=async_client.chat.completions,
+    )
+    return ResilientChatModel(
+        model=chat_model,
+        max_attempts=int(os.getenv("LLM_MAX_ATTEMPTS", "3")),
+        backoff=float(os.getenv("LLM_RETRY_BACKOFF_SECONDS", "0.5")),
+        hedge=os.getenv("LLM_HEDGE", "0") == "1",
+        hedge_min_delay=float(os.getenv("LLM_HEDGE_MIN_SECONDS", "1.0")),
+    )
+
+# --- Retries and hedging ---
+class ResilientChatModel(BaseChatModel):
+    """
+    Wraps a chat model so transient failures are retried with jittered
+    exponential backoff. With `hedge` on, a call that is still running after
+    the p95 of recent call latencies (never sooner than `hedge_min_delay`)
+    gets a second, identical request; whichever answers first wins. Streaming
+    calls are retried only until their first token, and never hedged.
+    """
+
+    model: BaseChatModel
+    max_attempts: int = 3
+    backoff: float = 0.5
+    hedge: bool = False
+    hedge_min_delay: float = 1.0
+    _latencies: Any = PrivateAttr(default_factory=lambda: deque(maxlen=200))
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self):
+        return f"resilient-{self.model._llm_type}"
+
+    def hedge_delay(self):
+        """Seconds to wait before hedging: the recent p95, once there are enough samples to trust it."""
+        with self._lock:
+            samples = list(self._latencies)
+        if len(samples) < 20:
+            return max(self.hedge_min_delay, 5.0)
+        return max(self.hedge_min_delay, float(np.percentile(samples, 95)))
+
+    # --- Blocking ---
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return self._with_retries(lambda: self._hedged(messages, stop, **kwargs))
+
+    def _with_retries(self, call):
+        for attempt in range(self.max_attempts):
+            try:
+                return call()
+            except TRANSIENT_ERRORS:
+                if attempt + 1 == self.max_attempts:
+                    LLM_ATTEMPTS.inc(outcome="failed")
+                    raise
+                LLM_ATTEMPTS.inc(outcome="retried")
+                time.sleep(self._backoff(attempt))
+
+    def _hedged(self, messages, stop, **kwargs):
+        if not self.hedge:
+            return self._timed(self.model._generate, messages, stop=stop, **kwargs)
+        first = _HEDGE_POOL.submit(self._timed, self.model._generate, messages, stop=stop, **kwargs)
+        done, _ = wait([first], timeout=self.hedge_delay())
+        if done:
+            return first.result()
+        LLM_ATTEMPTS.inc(outcome="hedged")
+        second = _HEDGE_POOL.submit(self._timed, self.model._generate, messages, stop=stop, **kwargs)
+        pending = {first, second}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = _first_success(done, second, pending)
+            if winner is not None:
+                # The other request is left to finish in the background; its result is dropped.
+                return winner.result()
+
+    # --- Async ---
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        for attempt in range(self.max_attempts):
+            try:
+                return await self._ahedged(messages, stop, **kwargs)
+            except TRANSIENT_ERRORS:
+                if attempt + 1 == self.max_attempts:
+                    LLM_ATTEMPTS.inc(outcome="failed")
+                    raise
+                LLM_ATTEMPTS.inc(outcome="retried")
+                await asyncio.sleep(self._backoff(attempt))
+
+    async def _ahedged(self, messages, stop, **kwargs):
+        if not self.hedge:
+            return await self._atimed(messages, stop, **kwargs)
+        first = asyncio.ensure_future(self._atimed(messages, stop, **kwargs))
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_delay())
+        if done:
+            return first.result()
+        LLM_ATTEMPTS.inc(outcome="hedged")
+        second = asyncio.ensure_future(self._atimed(messages, stop, **kwargs))
+        pending = {first, second}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = _first_success(done, second, pending)
+                if winner is not None:
+                    return winner.result()
+        finally:
+            for task in pending:
+                task.cancel()  # closes the loser's HTTP request
+
+    # --- Streaming ---
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        for attempt in range(self.max_attempts):
+            started = False
+            try:
+                for chunk in self.model._stream(messages, stop=stop, **kwargs):
+                    started = True
+                    yield chunk
+                LLM_ATTEMPTS.inc(outcome="ok")
+                return
+            except TRANSIENT_ERRORS:
+                if started or attempt + 1 == self.max_attempts:
+                    LLM_ATTEMPTS.inc(outcome="failed")
+                    raise  # tokens already went to the client; a retry would repeat them
+                LLM_ATTEMPTS.inc(outcome="retried")
+                time.sleep(self._backoff(attempt))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        for attempt in range(self.max_attempts):
+            started = False
+            try:
+                async for chunk in self.model._astream(messages, stop=stop, **kwargs):
+                    started = True
+                    yield chunk
+                LLM_ATTEMPTS.inc(outcome="ok")
+                return
+            except TRANSIENT_ERRORS:
+                if started or attempt + 1 == self.max_attempts:
+                    LLM_ATTEMPTS.inc(outcome="failed")
+                    raise
+                LLM_ATTEMPTS.inc(outcome="retried")
+                await asyncio.sleep(self._backoff(attempt))
+
+    # --- Helpers ---
+    def _timed(self, fn, *args, **kwargs):
+        started = time.perf_counter()
+        result = fn(*args, **kwargs)
+        self._record(time.perf_counter() - started)
+        return result
+
+    async def _atimed(self, messages, stop, **kwargs):
+        started = time.perf_counter()
+        result = await self.model._agenerate(messages, stop=stop, **kwargs)
+        self._record(time.perf_counter() - started)
+        return result
+
+    def _record(self, seconds):
+        LLM_ATTEMPTS.inc(outcome="ok")
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def _backoff(self, attempt):
+        # "Full jitter": spreads retries from many workers out instead of synchronising them.
+        return random.uniform(0, self.backoff * (2 ** attempt))
+
+def _first_success(done, hedge, pending):
+    """A finished request that succeeded; once nothing is pending, a failed one so its error is raised."""
+    for future in done:
+        if future.exception() is None:
+            if future is hedge:
+                LLM_ATTEMPTS.inc(outcome="hedge_won")
+            return future
+    return next(iter(done)) if not pending else None
+
+# Blocking hedges need a second thread while the first request is still waiting.
+_HEDGE_POOL = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_HEDGE_THREADS", "16")), thread_name_prefix="llm-hedge")
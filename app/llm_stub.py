@@ -0,0 +1,143 @@
+# In app/llm_stub.py
+"""
+A local stand-in for Together.ai's OpenAI-compatible chat endpoint, for
+testing timeouts, retries and hedging offline.
+
+    python -m app.llm_stub --port 8089 --latency-ms 400 --failure-rate 0.1 --slow-rate 0.05
+    LLM_BASE_URL=http://127.0.0.1:8089/v1 uvicorn app.main:app --port 5000
+
+Every request waits --latency-ms (plus up to --jitter-ms). A --failure-rate
+share are answered with a 503, and a --slow-rate share wait --slow-ms
+instead, which is what hedging and read timeouts are for. Condense prompts
+get the follow-up question back unchanged; everything else gets a fixed
+bullet-point answer.
+"""
+
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_ANSWER = "* This is a stub answer from the local LLM server.\n* It stands in for the policy LLM."
+
+class StubSettings:
+    def __init__(self, latency_ms=200, jitter_ms=50, failure_rate=0.0, slow_rate=0.0, slow_ms=10000, stream_chunk_ms=10):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.stream_chunk_ms = stream_chunk_ms
+        self.counts = {"requests": 0, "failed": 0, "slow": 0}
+        self._lock = threading.Lock()
+
+    def count(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+def _reply_for(messages):
+    prompt = messages[-1].get("content", "") if messages else ""
+    if "Follow Up Input:" in prompt:
+        return prompt.split("Follow Up Input:", 1)[1].split("\n", 1)[0].strip()
+    return STUB_ANSWER
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so the client's connection pool is exercised
+    settings = StubSettings()
+
+    def handle(self):
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client gave up (timeout, or a hedged request it no longer needs)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._json(404, {"error": {"message": f"No route {self.path}"}})
+        settings = self.settings
+        settings.count("requests")
+        if random.random() < settings.failure_rate:
+            settings.count("failed")
+            return self._json(503, {"error": {"message": "Injected failure", "type": "server_error"}})
+        delay_ms = settings.latency_ms + random.uniform(0, settings.jitter_ms)
+        if random.random() < settings.slow_rate:
+            settings.count("slow")
+            delay_ms = settings.slow_ms
+        time.sleep(delay_ms / 1000)
+
+        text = _reply_for(body.get("messages", []))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = body.get("model", "stub")
+        if body.get("stream"):
+            return self._stream(completion_id, model, text)
+        self._json(200, {
+            "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(text.split()), "total_tokens": len(text.split())},
+        })
+
+    def _stream(self, completion_id, model, text):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")  # no Content-Length; the stream ends when the socket does
+        self.end_headers()
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            piece = word if i == 0 else " " + word
+            self._event({"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                         "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]})
+            time.sleep(self.settings.stream_chunk_ms / 1000)
+        self._event({"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                     "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+    def _event(self, payload):
+        self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def _json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # one line per request would drown out the benchmark's output
+
+def serve(host="127.0.0.1", port=8089, settings=None):
+    """Starts the stub in a background thread and returns the server; call .shutdown() to stop it."""
+    handler = type("Handler", (StubHandler,), {"settings": settings or StubSettings()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="llm-stub").start()
+    return server
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.llm_stub", description="Offline OpenAI-compatible chat endpoint.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of requests answered with a 503")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="share of requests that take --slow-ms")
+    parser.add_argument("--slow-ms", type=float, default=10000)
+    parser.add_argument("--stream-chunk-ms", type=float, default=10, help="delay between streamed words")
+    args = parser.parse_args(argv)
+    settings = StubSettings(args.latency_ms, args.jitter_ms, args.failure_rate, args.slow_rate, args.slow_ms, args.stream_chunk_ms)
+    server = serve(args.host, args.port, settings)
+    print(f"✅ Stub LLM listening on http://{args.host}:{args.port}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(f"Served {settings.counts}")
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,72 @@
 # In app/main.py
 
 import os
-import shutil
-from fastapi import FastAPI, Request, UploadFile, File
-from fastapi.responses import JSONResponse
+import sys
+import time
+import json
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from .core import ChatbotCore
 from fastapi.middleware.cors import CORSMiddleware
+from . import metrics
+from .uploads import EmptyUpload, UploadStore, UploadTooLarge
 
-app = FastAPI(title="Policy AI Agent")
+# --- Receipts are stored by content hash under UPLOADS_DIR (see app/uploads.py) ---
+uploads = UploadStore()
 
-# --- Create an 'uploads' directory if it doesn't exist ---
-UPLOADS_DIR = "uploads"
-os.makedirs(UPLOADS_DIR, exist_ok=True)
-# --------------------------------------------------------
+# --- Chatbot loading ---
+# ChatbotCore pulls in torch, sentence-transformers, FAISS and LangChain, so it is
+# imported and built after uvicorn has bound the port; /ready reports when it's done.
+chatbot = None
+startup = {"status": "starting", "error": None, "seconds": None}
+
+def _load_chatbot():
+    from .core import ChatbotCore
+    started = time.perf_counter()
+    bot = ChatbotCore(uploads=uploads)
+    if os.getenv("WARMUP", "1") != "0":
+        bot.warmup()
+    startup.update(status="ready", seconds=round(time.perf_counter() - started, 2))
+    return bot
+
+async def _load_in_background():
+    global chatbot
+    try:
+        chatbot = await asyncio.to_thread(_load_chatbot)
+    except Exception as e:
+        startup.update(status="failed", error=str(e))
+        print(f"❌ ChatbotCore failed to load: {e}")
+
+# PRELOAD_CHATBOT=1 loads at import time instead, e.g. under
+# `gunicorn -k uvicorn.workers.UvicornWorker --preload`, so forked workers share
+# the model and index pages copy-on-write.
+if os.getenv("PRELOAD_CHATBOT", "0") == "1":
+    chatbot = _load_chatbot()
+
+@asynccontextmanager
+async def lifespan(app):
+    loader = None
+    if chatbot is None:
+        loader = asyncio.create_task(_load_in_background())
+    else:
+        # Threads don't survive the fork into a preloaded worker.
+        chatbot.outbox.start()
+    yield
+    uploads.receipts.close()
+    if loader is not None and not loader.done():
+        return  # Shut down mid-load; there is nothing to save yet.
+    if chatbot is not None:
+        try:
+            chatbot.answer_cache.save()
+        except Exception as e:
+            print(f"Error saving answer cache: {e}")
+        chatbot.outbox.close()
+        chatbot.executor.shutdown(wait=False)
+
+app = FastAPI(title="Policy AI Agent", lifespan=lifespan)
 
 origins = [
     "http://localhost:8000",
@@ -28,38 +81,162 @@ app.add_middleware(
 )
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
-chatbot = ChatbotCore()
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving HTTP, whether or not the models are loaded."""
+    return JSONResponse(content={"status": "ok"})
+
+@app.get("/ready")
+async def ready():
+    """Readiness: 200 once ChatbotCore is loaded and warmed up, 503 before that or if loading failed."""
+    status_code = 200 if chatbot is not None else 503
+    return JSONResponse(content=startup, status_code=status_code)
+
+def _not_ready():
+    return JSONResponse(
+        content={"error": "The assistant is still starting up. Please try again in a moment."}, status_code=503
+    )
+
+# --- Request logs and /metrics ---
+# One JSON line per chat request (request id, tier, per-stage milliseconds) on stdout.
+_log_handler = logging.StreamHandler(sys.stdout)
+_log_handler.setFormatter(logging.Formatter("%(message)s"))
+metrics.request_log.addHandler(_log_handler)
+metrics.request_log.setLevel(logging.INFO)
+metrics.request_log.propagate = False
+
+def _cache_counts():
+    if chatbot is None:
+        return
+    caches = (("query_embedding", chatbot.query_cache.stats()), ("answer", chatbot.answer_cache.stats()), ("precomputed", chatbot.precomputed.stats()))
+    for cache, stats in caches:
+        for result in ("hits", "misses", "coalesced"):
+            if result in stats:
+                yield (cache, result), stats[result]
+
+metrics.register(metrics.Gauges(
+    "chatbot_cache_lookups_total", "Query-embedding, answer and precomputed-answer lookups by result.",
+    ["cache", "result"], _cache_counts, kind="counter",
+))
+metrics.register(metrics.Gauges(
+    "chatbot_cache_entries", "Entries held in each cache.", ["cache"],
+    lambda: [
+        (("query_embedding",), chatbot.query_cache.stats()["size"]), (("answer",), chatbot.answer_cache.stats()["size"]),
+        (("precomputed",), len(chatbot.precomputed)),
+    ] if chatbot else [],
+))
+metrics.register(metrics.Gauges("chatbot_sessions", "Chat sessions held in memory.", [], lambda: [((), len(chatbot.sessions))] if chatbot else []))
+metrics.register(metrics.Gauges("chatbot_outbox_pending", "Emails waiting in the outbox.", [], lambda: [((), chatbot.outbox.pending_count())] if chatbot else []))
+metrics.register(metrics.Gauges("chatbot_ready", "1 once the models are loaded and warmed up.", [], lambda: [((), int(chatbot is not None))]))
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text exposition of the stage timings, request counts and cache counters."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 @app.post("/chat")
 async def handle_chat(request: Request):
     """Handle incoming chat messages."""
     data = await request.json()
     user_message = data.get("message")
+    session_id = data.get("session_id")
 
     if not user_message:
         return JSONResponse(content={"error": "No message provided"}, status_code=400)
+    if chatbot is None:
+        return _not_ready()
+    trace = metrics.start_trace(request.headers.get("x-request-id"), session_id=session_id)
+    headers = {"X-Request-ID": trace["request_id"]}
+    started = time.perf_counter()
     try:
-        bot_response = chatbot.get_answer(user_message)
-        return JSONResponse(content={"response": bot_response})
+        bot_response = await chatbot.aget_answer(user_message, session_id)
+        metrics.finish_trace(trace, "chat", started)
+        return JSONResponse(content={"response": bot_response}, headers=headers)
     except Exception as e:
-        return JSONResponse(content={"error": str(e)}, status_code=500)
+        metrics.finish_trace(trace, "chat", started, error=e)
+        return JSONResponse(content={"error": str(e)}, status_code=500, headers=headers)
+
+@app.post("/chat/stream")
+async def handle_chat_stream(request: Request):
+    """Same as /chat, but sends the reply as server-sent events so RAG tokens show up as they arrive."""
+    data = await request.json()
+    user_message = data.get("message")
+    session_id = data.get("session_id")
+
+    if not user_message:
+        return JSONResponse(content={"error": "No message provided"}, status_code=400)
+    if chatbot is None:
+        return _not_ready()
+
+    request_id = request.headers.get("x-request-id") or metrics.new_request_id()
+
+    async def event_stream():
+        trace = metrics.start_trace(request_id, session_id=session_id)
+        started = time.perf_counter()
+        try:
+            async for kind, text in chatbot.astream_answer(user_message, session_id):
+                yield _sse({"type": kind, "text": text})
+            yield _sse({"type": "done"})
+            metrics.finish_trace(trace, "chat_stream", started)
+        except Exception as e:
+            metrics.finish_trace(trace, "chat_stream", started, error=e)
+            yield _sse({"type": "error", "error": str(e)})
+
+    return StreamingResponse(
+        event_stream(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Request-ID": request_id},
+    )
+
+def _sse(payload):
+    return f"data: {json.dumps(payload)}\n\n"
 
 # --- NEW: Endpoint for handling file uploads ---
 @app.post("/upload")
-async def upload_receipt(file: UploadFile = File(...)):
-    file_path = os.path.join(UPLOADS_DIR, file.filename)
+async def upload_receipt(request: Request):
+    """
+    The receipt is the raw request body (the widget POSTs the File itself) and
+    its name is the `filename` query parameter. The body is streamed straight
+    into the upload store, so an oversized upload is cut off at the limit,
+    chunked or not, and an accepted one is written to disk once.
+    """
+    if request.headers.get("content-type", "").startswith("multipart/"):
+        return JSONResponse(content={"error": "Send the receipt as the request body, with ?filename=<name>."}, status_code=415)
+    # Refuse oversized bodies that announce their size before reading any of it.
+    content_length = int(request.headers.get("content-length") or 0)
+    if content_length > uploads.max_bytes:
+        return JSONResponse(content={"error": f"Receipts can be at most {uploads.max_bytes // (1024 * 1024)} MB."}, status_code=413)
+    filename = request.query_params.get("filename", "")
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        # Return the path so the bot knows where the file is
-        return JSONResponse(content={"file_path": file_path}, status_code=200)
+        handle, size, duplicate = await uploads.save_stream(request.stream(), filename)
+    except UploadTooLarge as e:
+        return JSONResponse(content={"error": str(e)}, status_code=413)
+    except EmptyUpload as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
     except Exception as e:
         return JSONResponse(content={"error": f"Could not save file: {e}"}, status_code=500)
+    # Compress it now, in the receipt process pool, so it's ready by the time the claim is confirmed.
+    try:
+        uploads.receipts.submit(os.path.join(uploads.root, handle))
+    except Exception as e:
+        # The receipt is stored; without the early start the sender just attaches it as uploaded.
+        print(f"⚠️ Could not queue receipt {handle} for compression: {e}")
+    # The handle goes back into the chat as "receipt_uploaded: <handle>"
+    return JSONResponse(content={
+        "handle": handle, "file_path": os.path.join(uploads.root, handle), "size": size, "duplicate": duplicate,
+    }, status_code=200)
 # --------------------------------------------
 
 @app.post("/reset")
-async def reset_chat():
-    """Clears both the LangChain memory and the task-specific conversation state."""
-    chatbot.get_memory().clear()
-    chatbot.reset_conversation_state()
-    return JSONResponse(content={"status": "Conversation memory and state cleared."})
\ No newline at end of file
+async def reset_chat(request: Request):
+    """Clears both the chat memory and the task-specific conversation state of one session."""
+    try:
+        data = await request.json()
+    except Exception:
+        data = {}
+    session_id = data.get("session_id")
+    if chatbot is None:
+        return _not_ready()
+    chatbot.get_memory(session_id).clear()
+    chatbot.reset_conversation_state(session_id)
+    return JSONResponse(content={"status": "Conversation memory and state cleared."})
@@ -0,0 +1,85 @@
+# In app/memory.py
+
+import os
+import math
+from collections import deque
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+# --- Token estimate ---
+def estimate_tokens(text):
+    """
+    Cheap stand-in for the model's tokenizer: about four characters per token
+    for English, but never fewer tokens than words. Close enough for budgeting
+    and runs in microseconds.
+    """
+    if not text:
+        return 0
+    return max(math.ceil(len(text) / 4), len(text.split()))
+
+def _clip(text, max_tokens):
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[:max(0, max_tokens * 4 - 3)].rstrip() + "..."
+
+# --- Chat history with a token budget ---
+class TokenBudgetMemory:
+    """
+    Drop-in for ConversationBufferMemory as ChatbotCore uses it
+    (save_context / load_memory_variables / clear). The most recent
+    `window_turns` question/answer pairs are kept word for word as long as
+    they fit in `max_tokens`; older turns are folded into a one-line summary
+    of the questions asked, itself capped at `summary_tokens`. The history
+    handed to the condense prompt therefore stays the same size however long
+    the session runs.
+    """
+
+    def __init__(self, max_tokens=None, window_turns=None, summary_tokens=None):
+        self.max_tokens = max_tokens or int(os.getenv("MEMORY_MAX_TOKENS", "1000"))
+        self.window_turns = window_turns or int(os.getenv("MEMORY_WINDOW_TURNS", "4"))
+        self.summary_tokens = summary_tokens or int(os.getenv("MEMORY_SUMMARY_TOKENS", "150"))
+        self.memory_key = "chat_history"
+        self.clear()
+
+    @property
+    def memory_variables(self):
+        return [self.memory_key]
+
+    def save_context(self, inputs, outputs):
+        question = _clip(inputs["question"], self.max_tokens // 4)
+        answer = _clip(outputs["answer"], self.max_tokens // 2)
+        tokens = estimate_tokens(question) + estimate_tokens(answer)
+        self._turns.append((question, answer, tokens))
+        self._turn_tokens += tokens
+        while len(self._turns) > 1 and (
+            len(self._turns) > self.window_turns or self._turn_tokens + self._summary_token_count > self.max_tokens
+        ):
+            old_question, _, old_tokens = self._turns.popleft()
+            self._turn_tokens -= old_tokens
+            self._summarize(old_question)
+
+    def load_memory_variables(self, inputs=None):
+        messages = []
+        if self._summary_questions:
+            messages.append(SystemMessage(content=self._summary()))
+        for question, answer, _ in self._turns:
+            messages += [HumanMessage(content=question), AIMessage(content=answer)]
+        return {self.memory_key: messages}
+
+    def clear(self):
+        self._turns = deque()
+        self._turn_tokens = 0
+        self._summary_questions = deque()
+        self._summary_token_count = 0
+
+    def token_count(self):
+        return self._turn_tokens + self._summary_token_count
+
+    # --- Running summary ---
+    def _summarize(self, question):
+        self._summary_questions.append(question.strip().rstrip("?.! "))
+        while len(self._summary_questions) > 1 and estimate_tokens(self._summary()) > self.summary_tokens:
+            self._summary_questions.popleft()
+        self._summary_token_count = estimate_tokens(self._summary())
+
+    def _summary(self):
+        return "Earlier in this conversation the employee asked about: " + "; ".join(self._summary_questions) + "."
@@ -0,0 +1,173 @@
+# In app/metrics.py
+
+import json
+import time
+import uuid
+import bisect
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# --- Prometheus-style metrics (text exposition format, no client library needed) ---
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames + ('le',), key + (_number(bound),))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames + ('le',), key + ('+Inf',))} {series[-1]}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(series[-2])}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+class Gauges:
+    """Values read from a callback at scrape time, e.g. cache sizes and hit counts already kept elsewhere."""
+
+    def __init__(self, name, documentation, labelnames, collect, kind="gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+        self.kind = kind
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in self.collect():
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+REGISTRY = []
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        try:
+            lines += metric.render()
+        except Exception as e:
+            # A broken callback must not take /metrics down with it.
+            lines.append(f"# error rendering {metric.name}: {e}")
+    return "\n".join(lines) + "\n"
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+# --- The chatbot's metrics ---
+STAGE_SECONDS = Histogram("chatbot_stage_seconds", "Time spent in each stage of answering a message.", ["stage"])
+REQUEST_SECONDS = Histogram("chatbot_request_seconds", "End-to-end time per chat request.", ["endpoint", "tier"])
+REQUESTS = Counter("chatbot_requests_total", "Chat requests by the tier that answered them.", ["endpoint", "tier"])
+LLM_TOKENS = Counter("chatbot_llm_tokens_total", "Estimated LLM prompt (in) and completion (out) tokens.", ["call", "direction"])
+EMAILS = Counter("chatbot_emails_total", "Outbox delivery attempts by result.", ["result"])
+ENCODE_BATCH_SIZE = Histogram(
+    "chatbot_encode_batch_size", "Texts per MiniLM forward pass after micro-batching.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+
+# --- Per-request trace ---
+_trace = contextvars.ContextVar("chatbot_trace", default=None)
+request_log = logging.getLogger("app.requests")
+
+def new_request_id():
+    return uuid.uuid4().hex[:16]
+
+def start_trace(request_id=None, **fields):
+    """Starts collecting stage timings for the current request; returns the trace dict."""
+    trace = {"request_id": request_id or new_request_id(), "tier": None, "stages_ms": {}, **fields}
+    _trace.set(trace)
+    return trace
+
+def annotate(**fields):
+    """Adds fields to the current request's log line, e.g. the standalone question app.precompute reads back."""
+    trace = _trace.get()
+    if trace is not None:
+        trace.update(fields)
+
+def set_tier(tier):
+    trace = _trace.get()
+    if trace is not None:
+        trace["tier"] = tier
+
+@contextmanager
+def stage(name):
+    """Times a block into chatbot_stage_seconds and, inside a request, into its trace."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        trace = _trace.get()
+        if trace is not None:
+            stages = trace["stages_ms"]
+            stages[name] = round(stages.get(name, 0.0) + elapsed * 1000, 3)
+
+def finish_trace(trace, endpoint, started, error=None):
+    """Records the request in the metrics and writes its structured log line."""
+    elapsed = time.perf_counter() - started
+    tier = "error" if error else (trace["tier"] or "unknown")
+    REQUESTS.inc(endpoint=endpoint, tier=tier)
+    REQUEST_SECONDS.observe(elapsed, endpoint=endpoint, tier=tier)
+    record = {"event": "chat", "endpoint": endpoint, **trace, "tier": tier, "duration_ms": round(elapsed * 1000, 3)}
+    if error:
+        record["error"] = str(error)
+    request_log.info(json.dumps(record))
@@ -0,0 +1,273 @@
+# In app/outbox.py
+
+import os
+import time
+import random
+import socket
+import sqlite3
+import smtplib
+import threading
+import mimetypes
+from email.message import EmailMessage
+from .metrics import EMAILS, stage
+
+# --- Message building ---
+def build_email_message(sender, to_address, subject, body, attachment_path=None):
+    msg = EmailMessage()
+    msg.set_content(body)
+    msg['Subject'] = subject
+    msg['From'] = sender
+    msg['To'] = to_address
+
+    # If there is an attachment, add it to the email
+    if attachment_path and os.path.exists(attachment_path):
+        ctype, encoding = mimetypes.guess_type(attachment_path)
+        if ctype is None or encoding is not None:
+            ctype = 'application/octet-stream'
+        maintype, subtype = ctype.split('/', 1)
+        with open(attachment_path, 'rb') as fp:
+            msg.add_attachment(fp.read(),
+                               maintype=maintype,
+                               subtype=subtype,
+                               filename=os.path.basename(attachment_path))
+    return msg
+
+def simulate_email(to_address, subject, body, attachment_path=None):
+    print("❌ ERROR: SENDER_EMAIL or SENDER_PASSWORD not set in .env file. Cannot send real email.")
+    # Fallback to simulation if credentials are not set
+    print("--- SIMULATING EMAIL SEND ---")
+    print(f"To: {to_address}\nSubject: {subject}\nBody:{body}")
+    if attachment_path: print(f"Attachment: {attachment_path}")
+    print("---------------------------")
+
+# --- SMTP settings (.env) ---
+class SmtpSettings:
+    """
+    Where mail goes. Defaults to Gmail over SSL; point SMTP_HOST/SMTP_PORT at a
+    local debugging server (SMTP_SSL=0) to test without sending real email.
+    """
+
+    def __init__(self):
+        self.host = os.getenv("SMTP_HOST", "smtp.gmail.com")
+        self.port = int(os.getenv("SMTP_PORT", "465"))
+        self.use_ssl = os.getenv("SMTP_SSL", "1") != "0"
+        self.timeout = float(os.getenv("SMTP_TIMEOUT_SECONDS", "30"))
+        self.sender = os.getenv("SENDER_EMAIL")
+        self.password = os.getenv("SENDER_PASSWORD")
+        # Gmail needs the app password; a local debugging server set via SMTP_HOST needs no login.
+        self.configured = bool(self.sender) and (bool(self.password) or "SMTP_HOST" in os.environ)
+
+    def connect(self):
+        smtp_class = smtplib.SMTP_SSL if self.use_ssl else smtplib.SMTP
+        server = smtp_class(self.host, self.port, timeout=self.timeout)
+        if self.password:
+            server.login(self.sender, self.password)
+        return server
+
+# --- Durable outbox ---
+class EmailOutbox:
+    """
+    Leave and expense confirmations are written to a SQLite queue and the chat
+    reply goes out straight away. A background thread sends queued mail over
+    one authenticated SMTP connection that it keeps open between messages,
+    retrying failures with exponential backoff and jitter. Mail still queued
+    at shutdown is sent after the next start.
+
+    Every worker process runs its own sender on the same database, so a row is
+    claimed (status 'sending') before it is sent and only the claimant sends
+    it. A claim older than OUTBOX_CLAIM_SECONDS, left by a worker that died
+    mid-send, is picked up again.
+    """
+
+    def __init__(self, db_path=None, settings=None, max_attempts=None, idle_timeout=60):
+        self.db_path = db_path or os.getenv("OUTBOX_PATH", "data/outbox.sqlite")
+        self.settings = settings or SmtpSettings()
+        self.max_attempts = max_attempts or int(os.getenv("OUTBOX_MAX_ATTEMPTS", "6"))
+        self.backoff_base = float(os.getenv("OUTBOX_BACKOFF_SECONDS", "5"))
+        self.backoff_max = 900
+        self.claim_seconds = float(os.getenv("OUTBOX_CLAIM_SECONDS", "300"))
+        self._owner = None
+        self.idle_timeout = idle_timeout
+        # Optional callable(path) -> path, run by the sender: ChatbotCore swaps in the compressed receipt here.
+        self.prepare_attachment = None
+        self._smtp = None
+        self._last_used = 0.0
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._init_db()
+        self.start()
+
+    def start(self):
+        """Starts the sender thread if it isn't running, e.g. in a worker forked after preloading."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping = False
+        self._smtp = None  # a connection inherited across fork belongs to the parent
+        self._owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._thread = threading.Thread(target=self._run, name="email-outbox", daemon=True)
+        self._thread.start()
+
+    def enqueue(self, to_address, subject, body, attachment_path=None):
+        """Queues an email and returns its outbox id; sending happens in the background."""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO outbox (to_address, subject, body, attachment_path, next_attempt_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (to_address, subject, body, attachment_path, time.time(), time.time()),
+            )
+            email_id = cursor.lastrowid
+        conn.close()
+        self._wakeup.set()
+        print(f"📨 Email {email_id} to {to_address} queued.")
+        return email_id
+
+    def close(self, timeout=10):
+        self._stopping = True
+        self._wakeup.set()
+        self._thread.join(timeout)
+
+    def pending_count(self):
+        with self._connect() as conn:
+            count = conn.execute("SELECT COUNT(*) FROM outbox WHERE status IN ('pending', 'sending')").fetchone()[0]
+        conn.close()
+        return count
+
+    # --- Worker ---
+    def _run(self):
+        while not self._stopping:
+            try:
+                row = self._next_due()
+                if row is None:
+                    self._close_idle_connection()
+                    self._wakeup.wait(timeout=self._seconds_until_next_due())
+                    self._wakeup.clear()
+                    continue
+                self._deliver(row)
+            except Exception as e:
+                # A locked or broken queue db must not kill the sender: log it, back off and try
+                # again. A row we claimed but couldn't settle is picked up once its claim expires.
+                print(f"⚠️ Outbox sender error, retrying in {self.backoff_base:.0f}s: {e}")
+                self._wakeup.wait(timeout=self.backoff_base)
+                self._wakeup.clear()
+        self._disconnect()
+
+    def _deliver(self, row):
+        email_id, to_address, subject, body, attachment_path, attempts = row
+        try:
+            if attachment_path and self.prepare_attachment is not None:
+                attachment_path = self.prepare_attachment(attachment_path)
+            if not self.settings.configured:
+                simulate_email(to_address, subject, body, attachment_path)
+                self._mark_sent(email_id)
+                EMAILS.inc(result="simulated")
+                return
+            msg = build_email_message(self.settings.sender, to_address, subject, body, attachment_path)
+            with stage("email_send"):
+                self._send(msg)
+            self._mark_sent(email_id)
+            EMAILS.inc(result="sent")
+            print(f"✅ Email successfully sent to {to_address}")
+        except Exception as e:
+            self._disconnect()
+            EMAILS.inc(result="failed")
+            self._mark_failed(email_id, attempts + 1, e)
+
+    def _send(self, msg):
+        if self._smtp is None:
+            self._smtp = self.settings.connect()
+        try:
+            self._smtp.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # The server dropped our idle connection; reconnect once and retry.
+            self._smtp = self.settings.connect()
+            self._smtp.send_message(msg)
+        self._last_used = time.monotonic()
+
+    def _close_idle_connection(self):
+        if self._smtp is not None and time.monotonic() - self._last_used > self.idle_timeout:
+            self._disconnect()
+
+    def _disconnect(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except Exception:
+            pass
+        self._smtp = None
+
+    # --- Queue storage ---
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _init_db(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS outbox ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " to_address TEXT NOT NULL, subject TEXT NOT NULL, body TEXT NOT NULL, attachment_path TEXT,"
+                " status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0,"
+                " next_attempt_at REAL NOT NULL, last_error TEXT, created_at REAL NOT NULL, sent_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at)")
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(outbox)")}
+            if "claimed_by" not in columns:  # queues created before senders claimed rows
+                conn.execute("ALTER TABLE outbox ADD COLUMN claimed_by TEXT")
+                conn.execute("ALTER TABLE outbox ADD COLUMN claimed_at REAL")
+        conn.close()
+
+    def _next_due(self):
+        """Claims the next due email for this process and returns it, or None."""
+        while True:
+            now = time.time()
+            stale = now - self.claim_seconds
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT id, to_address, subject, body, attachment_path, attempts FROM outbox "
+                    "WHERE (status = 'pending' AND next_attempt_at <= ?) OR (status = 'sending' AND claimed_at < ?) "
+                    "ORDER BY next_attempt_at LIMIT 1",
+                    (now, stale),
+                ).fetchone()
+                claimed = row is not None and conn.execute(
+                    "UPDATE outbox SET status = 'sending', claimed_by = ?, claimed_at = ? "
+                    "WHERE id = ? AND (status = 'pending' OR (status = 'sending' AND claimed_at < ?))",
+                    (self._owner, now, row[0], stale),
+                ).rowcount == 1
+            conn.close()
+            if row is None or claimed:
+                return row
+            # Another worker claimed it between the SELECT and the UPDATE; look again.
+
+    def _seconds_until_next_due(self):
+        with self._connect() as conn:
+            row = conn.execute("SELECT MIN(next_attempt_at) FROM outbox WHERE status = 'pending'").fetchone()
+        conn.close()
+        if row[0] is None:
+            return self.idle_timeout
+        return max(0.0, min(self.idle_timeout, row[0] - time.time()))
+
+    def _mark_sent(self, email_id):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE outbox SET status = 'sent', sent_at = ?, claimed_by = NULL WHERE id = ? AND claimed_by = ?",
+                (time.time(), email_id, self._owner),
+            )
+        conn.close()
+
+    def _mark_failed(self, email_id, attempts, error):
+        if attempts >= self.max_attempts:
+            status, next_attempt_at = 'failed', time.time()
+            print(f"❌ Giving up on email {email_id} after {attempts} attempts: {error}")
+        else:
+            delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+            status, next_attempt_at = 'pending', time.time() + delay * random.uniform(0.5, 1.5)
+            print(f"❌ Failed to send email {email_id} (attempt {attempts}), retrying in {delay:.0f}s: {error}")
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, claimed_by = NULL "
+                "WHERE id = ? AND claimed_by = ?",
+                (status, attempts, next_attempt_at, str(error), email_id, self._owner),
+            )
+        conn.close()
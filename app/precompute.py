@@ -0,0 +1,107 @@
+# In app/precompute.py
+"""
+Builds the precomputed-answer store that ChatbotCore serves at startup.
+
+    python -m app.precompute --query-log logs/requests.log --top 500 --workers 8
+
+Questions come from the keys of data/faqs.json plus the most frequent
+standalone questions in request logs (the "question" field of the JSON lines
+/chat writes). Each one goes through the same pipeline as a live RAG request:
+retrieval, the extractive fast path or context packing, then qa_chain. The
+answers, the chunks they were built from, and the FAISS index version are
+written to PRECOMPUTED_ANSWERS_PATH. Rerun it after rebuilding the index; a
+store built for another index version is ignored.
+"""
+
+import os
+import json
+import time
+import hashlib
+import argparse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from .embeddings import normalize_query
+from .precomputed import write_store
+
+def collect_questions(faqs_path, query_logs, top):
+    """FAQ keys first, then logged questions by how often they were asked; near-identical spellings are merged."""
+    questions = {}
+    if faqs_path and os.path.exists(faqs_path):
+        with open(faqs_path, 'r') as f:
+            for question in json.load(f):
+                questions.setdefault(normalize_query(question), question)
+    asked = Counter()
+    spelling = {}
+    for path in query_logs:
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    question = json.loads(line).get("question")
+                except (ValueError, AttributeError):
+                    continue  # startup banners and other non-JSON output
+                if question:
+                    key = normalize_query(question)
+                    asked[key] += 1
+                    spelling.setdefault(key, question)
+    for key, _ in asked.most_common():
+        if len(questions) >= top:
+            break
+        questions.setdefault(key, spelling[key])
+    return list(questions.values())[:top]
+
+def chunk_ref(doc):
+    return {
+        # Same content hash app.ingest keys its embedding cache with, so it survives rebuilds.
+        "chunk_id": hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest(),
+        "source": doc.metadata.get("source"),
+        "page": doc.metadata.get("page"),
+    }
+
+def precompute(chatbot, questions, workers):
+    """Runs every question through the RAG pipeline in parallel; returns (vectors, answers, sources)."""
+    vectors = chatbot.encoder.encode(questions)
+
+    def answer(i):
+        text, hits = chatbot._compose_answer(questions[i], vectors[i])
+        return text, [chunk_ref(doc) for doc, _ in hits]
+
+    results = []
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for done, result in enumerate(pool.map(answer, range(len(questions))), 1):
+            results.append(result)
+            if done % 25 == 0 or done == len(questions):
+                print(f"{done}/{len(questions)} answered ({time.perf_counter() - started:.1f}s)")
+    return vectors, [text for text, _ in results], [refs for _, refs in results]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.precompute", description="Precompute answers to the most asked policy questions.")
+    parser.add_argument("--faqs", default="data/faqs.json", help="questions to include first ('' to skip)")
+    parser.add_argument("--query-log", action="append", default=[], help="JSON-lines request log; repeatable")
+    parser.add_argument("--top", type=int, default=500, help="questions to precompute")
+    parser.add_argument("--workers", type=int, default=8, help="questions answered in parallel")
+    parser.add_argument("--index", default="data/mpc_faiss_index", help="FAISS index directory")
+    parser.add_argument("--output", default=None, help="store directory (default: PRECOMPUTED_ANSWERS_PATH or data/precomputed_answers)")
+    parser.add_argument("--llm-url", help="OpenAI-compatible endpoint to use instead of LLM_BASE_URL, e.g. app.llm_stub")
+    args = parser.parse_args(argv)
+    load_dotenv()
+
+    from .core import ChatbotCore
+    from .llm_client import build_chat_model
+
+    questions = collect_questions(args.faqs, args.query_log, args.top)
+    if not questions:
+        parser.error("no questions found; pass --query-log or keep --faqs")
+    llm = build_chat_model(os.getenv("TOGETHERAI_API_KEY", "precompute"), base_url=args.llm_url) if args.llm_url else None
+    chatbot = ChatbotCore(faiss_path=args.index, llm=llm)
+    try:
+        vectors, answers, sources = precompute(chatbot, questions, args.workers)
+        output = args.output or chatbot.precomputed.path
+        manifest = write_store(output, chatbot.index_version, chatbot.encoder.model_name, questions, vectors, answers, sources)
+        print(f"✅ Wrote {manifest['count']} answers for index {manifest['index_version']} to {output}.")
+    finally:
+        chatbot.outbox.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# In app/precomputed.py
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import tempfile
+import threading
+import numpy as np
+
+VECTORS_FILE = "vectors.npy"
+ANSWERS_FILE = "answers.sqlite"
+MANIFEST_FILE = "manifest.json"
+
+# --- Writing (python -m app.precompute) ---
+def write_store(path, index_version, model_name, questions, vectors, answers, sources):
+    """
+    Writes a store next to `path` and swaps it in file by file, manifest last,
+    the same way app.ingest publishes an index. `sources` holds, per answer, the
+    chunks it was built from as {"chunk_id", "source", "page"} dicts.
+    """
+    os.makedirs(path, exist_ok=True)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    build_path = tempfile.mkdtemp(prefix=".precomputed-build-", dir=os.path.dirname(os.path.abspath(path)))
+    np.save(os.path.join(build_path, VECTORS_FILE), vectors)
+    with sqlite3.connect(os.path.join(build_path, ANSWERS_FILE)) as conn:
+        conn.execute(
+            "CREATE TABLE answers (position INTEGER PRIMARY KEY, question TEXT NOT NULL, answer TEXT NOT NULL,"
+            " sources TEXT NOT NULL, vector_hash TEXT NOT NULL)"
+        )
+        conn.executemany(
+            "INSERT INTO answers VALUES (?, ?, ?, ?, ?)",
+            ((i, q, a, json.dumps(s), _vector_hash(v)) for i, (q, a, s, v) in enumerate(zip(questions, answers, sources, vectors))),
+        )
+    conn.close()
+    for name in (VECTORS_FILE, ANSWERS_FILE):
+        os.replace(os.path.join(build_path, name), os.path.join(path, name))
+    manifest = {
+        "index_version": index_version, "model": model_name, "count": len(questions),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+    with open(os.path.join(build_path, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(os.path.join(build_path, MANIFEST_FILE), os.path.join(path, MANIFEST_FILE))
+    os.rmdir(build_path)
+    return manifest
+
+# --- Serving ---
+class PrecomputedAnswers:
+    """
+    Answers to the most asked policy questions, generated offline by
+    `python -m app.precompute` and served before the answer cache and the LLM.
+    The question vectors are memory-mapped, so every worker shares one copy
+    of their pages; answer text is read from SQLite only on a hit. The store
+    is only used while its index_version matches the loaded FAISS index.
+
+    Both files are opened at startup, so a rerun of app.precompute under a
+    running server can't pair the old vectors with the new rows. Each row also
+    carries a hash of its question vector, and a row that doesn't match the
+    vector that was hit counts as a miss, never as a wrong answer.
+    """
+
+    def __init__(self, path=None, threshold=None):
+        self.path = path if path is not None else os.getenv("PRECOMPUTED_ANSWERS_PATH", "data/precomputed_answers")
+        self.threshold = threshold or float(os.getenv("PRECOMPUTED_THRESHOLD", os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")))
+        self.index_version = None
+        self.hits = 0
+        self.misses = 0
+        self._vectors = None
+        self._conn = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def __len__(self):
+        return 0 if self._vectors is None else len(self._vectors)
+
+    def lookup(self, vector, index_version):
+        """The stored answer for the closest question, or None (also when the store was built for another index)."""
+        if self._vectors is None or index_version != self.index_version:
+            return None
+        query = np.asarray(vector, dtype=np.float32)
+        scores = self._vectors @ (query / max(np.linalg.norm(query), 1e-12))
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            self.misses += 1
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT answer, vector_hash FROM answers WHERE position = ?", (best,)).fetchone()
+        if row is None or row[1] != _vector_hash(self._vectors[best]):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def stats(self):
+        return {"size": len(self), "hits": self.hits, "misses": self.misses}
+
+    def _load(self):
+        manifest_path = os.path.join(self.path, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            return
+        try:
+            with open(manifest_path, 'r') as f:
+                manifest = json.load(f)
+            vectors = np.load(os.path.join(self.path, VECTORS_FILE), mmap_mode="r")
+            if len(vectors) != manifest["count"]:
+                raise ValueError("vectors and manifest disagree; the store is being rewritten")
+            conn = sqlite3.connect(f"file:{os.path.join(self.path, ANSWERS_FILE)}?mode=ro", uri=True, check_same_thread=False)
+            conn.execute("SELECT vector_hash FROM answers LIMIT 1")  # stores from before the hash column need a rebuild
+            self._vectors, self._conn = vectors, conn
+            self.index_version = manifest["index_version"]
+            print(f"✅ Precomputed answers loaded: {len(vectors)} questions (index {self.index_version}).")
+        except Exception as e:
+            print(f"Error loading precomputed answers from {self.path}: {e}")
+
+def _vector_hash(vector):
+    return hashlib.sha1(np.ascontiguousarray(vector, dtype=np.float32).tobytes()).hexdigest()
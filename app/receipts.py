@@ -0,0 +1,147 @@
+# In app/receipts.py
+
+import os
+import io
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".bmp", ".gif", ".tif", ".tiff"}
+
+# --- The work itself (runs in a pool process) ---
+def optimize_receipt(path, output_path, max_dimension, jpeg_quality):
+    """
+    Writes a smaller copy of the receipt at `path` to `output_path`: images are
+    downsized to fit `max_dimension` and re-encoded as JPEG, PDFs are rewritten
+    with unused objects dropped and streams deflated. Returns the path to
+    attach, which is the original when the copy wouldn't be smaller.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in IMAGE_EXTENSIONS:
+        data = _optimize_image(path, max_dimension, jpeg_quality)
+    elif ext == ".pdf":
+        data = _optimize_pdf(path)
+    else:
+        return path
+    if len(data) >= os.path.getsize(path):
+        return path
+    tmp_path = f"{output_path}.tmp-{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+def _optimize_image(path, max_dimension, jpeg_quality):
+    from PIL import Image, ImageOps
+
+    with Image.open(path) as image:
+        image = ImageOps.exif_transpose(image)  # phone photos are often stored sideways
+        image.thumbnail((max_dimension, max_dimension))
+        if image.mode in ("RGBA", "LA", "P"):
+            # Screenshots carry transparency JPEG can't hold; flatten onto white.
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        out = io.BytesIO()
+        image.save(out, "JPEG", quality=jpeg_quality, optimize=True, progressive=True)
+    return out.getvalue()
+
+def _optimize_pdf(path):
+    import fitz  # PyMuPDF, already used to parse the policy book
+
+    with fitz.open(path) as doc:
+        return doc.tobytes(garbage=4, deflate=True, deflate_images=True, clean=True)
+
+# --- Receipt pre-processing ---
+class ReceiptProcessor:
+    """
+    Shrinks receipts in a small process pool as soon as they're uploaded, so
+    finance emails carry a compressed copy instead of the raw phone photo. The
+    result is cached next to the upload (uploads/<sha256>.r<dimension>q<quality>.jpg
+    or .pdf); uploads are content-addressed, so it never goes stale.
+    """
+
+    def __init__(self, max_workers=None, max_dimension=None, jpeg_quality=None, wait_seconds=None):
+        self.max_workers = max_workers or int(os.getenv("RECEIPT_WORKERS", "2"))
+        self.max_dimension = max_dimension or int(os.getenv("RECEIPT_MAX_DIMENSION", "1600"))
+        self.jpeg_quality = jpeg_quality or int(os.getenv("RECEIPT_JPEG_QUALITY", "80"))
+        self.wait_seconds = wait_seconds or float(os.getenv("RECEIPT_WAIT_SECONDS", "10"))
+        self._pool = None
+        self._pending = {}
+        self._lock = threading.RLock()  # a done callback can run inside submit()
+
+    def artifact_path(self, path):
+        stem, ext = os.path.splitext(path)
+        ext = ".pdf" if ext.lower() == ".pdf" else ".jpg"
+        return f"{stem}.r{self.max_dimension}q{self.jpeg_quality}{ext}"
+
+    def submit(self, path):
+        """
+        Starts optimizing `path` in the background and returns the future; None
+        if the copy already exists, or if the pool couldn't take the job (the
+        original is attached then).
+        """
+        if os.path.exists(self.artifact_path(path)):
+            return None
+        with self._lock:
+            future = self._pending.get(path)
+            if future is None:
+                for attempt in range(2):
+                    try:
+                        future = self._executor().submit(
+                            optimize_receipt, path, self.artifact_path(path), self.max_dimension, self.jpeg_quality,
+                        )
+                        break
+                    except Exception as e:
+                        # Typically BrokenProcessPool: a worker died (OOM on a huge photo, a crash in
+                        # PIL or PyMuPDF) and the pool refuses all further work. Retry once on a fresh one.
+                        self._discard_pool()
+                        if attempt:
+                            print(f"⚠️ Receipt pool unavailable, attaching {path} as uploaded: {e}")
+                            return None
+                self._pending[path] = future
+                future.add_done_callback(lambda _: self._forget(path))
+        return future
+
+    def attachment(self, path):
+        """
+        The file to attach for the receipt at `path`: the optimized copy when
+        there is one, otherwise the original. Waits up to `wait_seconds` for a
+        copy that is still being made; called from the outbox sender, never
+        from a chat turn.
+        """
+        future = self.submit(path)
+        if future is None:
+            artifact = self.artifact_path(path)
+            return artifact if os.path.exists(artifact) else path
+        try:
+            return future.result(timeout=self.wait_seconds)
+        except FutureTimeout:
+            return path  # the claim shouldn't wait on a slow conversion
+        except Exception as e:  # BrokenProcessPool included; the next submit() starts a new pool
+            print(f"⚠️ Could not optimize receipt {path}: {e}")
+            return path
+
+    def _forget(self, path):
+        with self._lock:
+            self._pending.pop(path, None)
+
+    def _discard_pool(self):
+        # Call with the lock held. Jobs still pending on a broken pool have failed already.
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        self._pending.clear()
+
+    def close(self):
+        with self._lock:
+            self._discard_pool()
+
+    def _executor(self):
+        if self._pool is None:
+            # Spawned rather than forked: the parent may already hold torch and FAISS threads.
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
@@ -0,0 +1,77 @@
+# In app/sessions.py
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from .memory import TokenBudgetMemory
+
+DEFAULT_SESSION_ID = "default"
+MAX_SESSION_ID_LENGTH = 128
+
+# --- A single chat user's state ---
+class Session:
+    """Task-flow state and chat history for one widget session."""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.state = {}
+        # Last few turns verbatim plus a summary of older ones, so prompts don't grow with the session.
+        self.memory = TokenBudgetMemory()
+        # Two tabs sharing a session id must not interleave the same leave/expense flow.
+        self.lock = threading.RLock()
+        # The standalone form of the last question sent to RAG, for rewriting the next follow-up.
+        self.last_question = None
+        self.last_seen = time.monotonic()
+
+# --- Bounded session store (TTL + LRU) ---
+class SessionStore:
+    """
+    Keeps sessions in least-recently-used order. Sessions idle for longer than
+    `ttl_seconds` are dropped, and once `max_sessions` is reached the least
+    recently used one is evicted, so memory stays flat however many users
+    open the widget and walk away.
+    """
+
+    def __init__(self, max_sessions=None, ttl_seconds=None):
+        self.max_sessions = max_sessions or int(os.getenv("SESSION_MAX", "5000"))
+        self.ttl_seconds = ttl_seconds or float(os.getenv("SESSION_TTL_SECONDS", "1800"))
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id=None):
+        """Returns the session for `session_id`, creating it if needed."""
+        session_id = normalize_session_id(session_id)
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = Session(session_id)
+                self._sessions[session_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_seen = now
+            return session
+
+    def discard(self, session_id=None):
+        with self._lock:
+            self._sessions.pop(normalize_session_id(session_id), None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _evict_expired(self, now):
+        # Sessions are ordered by last use, so all expired ones sit at the front.
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_seen < self.ttl_seconds:
+                break
+            self._sessions.popitem(last=False)
+
+def normalize_session_id(session_id):
+    if not session_id:
+        return DEFAULT_SESSION_ID
+    return str(session_id)[:MAX_SESSION_ID_LENGTH]
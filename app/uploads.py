@@ -0,0 +1,90 @@
+# In app/uploads.py
+
+import os
+import re
+import asyncio
+import hashlib
+import tempfile
+from .receipts import ReceiptProcessor
+
+CHUNK_SIZE = 1 << 20
+_HANDLE = re.compile(r"^[0-9a-f]{64}(\.[a-z0-9]{1,5})?$")
+
+class UploadTooLarge(ValueError):
+    pass
+
+class EmptyUpload(ValueError):
+    pass
+
+# --- Content-addressed receipt store ---
+class UploadStore:
+    """
+    Receipts are stored as uploads/<sha256><ext>. Two uploads of the same file
+    share one copy, and client file names never reach the filesystem, so
+    receipts can't overwrite each other. The "<sha256><ext>" handle is what the
+    widget sends back into the expense flow; resolve() turns it into a path
+    and refuses anything that isn't a stored receipt.
+    """
+
+    def __init__(self, root=None, max_bytes=None):
+        self.root = root or os.getenv("UPLOADS_DIR", "uploads")
+        self.max_bytes = max_bytes or int(os.getenv("UPLOAD_MAX_BYTES", str(10 * 1024 * 1024)))
+        self.receipts = ReceiptProcessor()
+        os.makedirs(self.root, exist_ok=True)
+
+    async def save_stream(self, chunks, filename):
+        """
+        Writes the async byte iterator `chunks` (the /upload request body) to
+        disk as it arrives, hashing on the way, and stops reading as soon as
+        max_bytes is exceeded. An empty body raises EmptyUpload and stores
+        nothing. Disk writes run in a worker thread, a buffered CHUNK_SIZE at
+        a time. Returns (handle, size, duplicate).
+        """
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(prefix=".upload-", dir=self.root)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                buffer = bytearray()
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise UploadTooLarge(f"Receipts can be at most {self.max_bytes // (1024 * 1024)} MB.")
+                    buffer += chunk
+                    if len(buffer) >= CHUNK_SIZE:
+                        await asyncio.to_thread(_write, out, digest, bytes(buffer))
+                        buffer.clear()
+                if buffer:
+                    await asyncio.to_thread(_write, out, digest, bytes(buffer))
+            if size == 0:
+                raise EmptyUpload("No file provided")
+            handle = digest.hexdigest() + _extension(filename)
+            path = os.path.join(self.root, handle)
+            duplicate = os.path.exists(path)
+            if duplicate:
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, path)
+            return handle, size, duplicate
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def resolve(self, handle):
+        """Path of a stored receipt, or None for anything that isn't a valid, existing handle."""
+        # The basename also accepts the uploads/<handle> path /upload returns as file_path.
+        handle = os.path.basename(handle.strip()).lower()
+        if not _HANDLE.match(handle):
+            return None
+        path = os.path.join(self.root, handle)
+        return path if os.path.exists(path) else None
+
+def _write(out, digest, data):
+    digest.update(data)
+    out.write(data)
+
+def _extension(filename):
+    # Kept so the email attachment gets the right MIME type; the rest of the name is dropped.
+    ext = os.path.splitext(filename or "")[1].lower()
+    return ext if re.fullmatch(r"\.[a-z0-9]{1,5}", ext) else ""
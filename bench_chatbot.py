@@ -0,0 +1,269 @@
+# bench_chatbot.py
+"""
+Replays a query corpus through ChatbotCore.get_answer with a stub LLM and a
+stub SMTP server, so it runs offline, and reports latency per routing tier.
+
+    python bench_chatbot.py --rounds 20 --output bench.json
+    python bench_chatbot.py --baseline bench.json   # exits 1 if a tier got slower
+    python bench_chatbot.py --llm-server --llm-delay 0.3 --llm-failure-rate 0.1
+
+--llm-server swaps the in-process stub model for the real HTTP client
+(app/llm_client.py) talking to app/llm_stub.py, so timeouts, retries and
+hedging are part of what is measured.
+
+Tiers: task_flow, employee_lookup and faq are timed end to end; rag is the
+whole get_answer call for questions that reach the policy index, and
+retrieval / llm are the FAISS search and chain calls inside it. The answer
+cache is bypassed unless --answer-cache is given, so every rag question
+really runs retrieval and the LLM.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import numpy as np
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+TIERS = ("task_flow", "employee_lookup", "faq", "rag", "retrieval", "llm")
+RAG_QUESTIONS = [
+    "What is the dress code policy?",
+    "How much notice do I have to give before resigning?",
+    "Can I work from home, and how do I request it?",
+    "What happens to unused annual leave at the end of the year?",
+    "Is there a policy on using personal devices for work?",
+]
+
+# --- Offline stand-ins ---
+class StubChatModel(BaseChatModel):
+    """Answers after `delay` seconds; condense prompts get the follow-up back unchanged."""
+
+    delay: float = 0.0
+    reply: str = "* This is a stub answer from the benchmark.\n* It stands in for the policy LLM."
+
+    @property
+    def _llm_type(self):
+        return "benchmark-stub"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.delay:
+            time.sleep(self.delay)
+        prompt = messages[-1].content
+        text = self.reply
+        if "Follow Up Input:" in prompt:
+            text = prompt.split("Follow Up Input:", 1)[1].split("\n", 1)[0].strip()
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+class StubSMTP:
+    sent = 0
+
+    def send_message(self, msg):
+        StubSMTP.sent += 1
+
+    def quit(self):
+        pass
+
+class StubSmtpSettings:
+    configured = True
+    sender = "bench@example.com"
+
+    def connect(self):
+        return StubSMTP()
+
+class Timed:
+    """Wraps a chain or function and records how long each call takes."""
+
+    def __init__(self, target, samples):
+        self.target = target
+        self.samples = samples
+
+    def __call__(self, *args, **kwargs):
+        return self._timed(self.target, *args, **kwargs)
+
+    def invoke(self, *args, **kwargs):
+        return self._timed(self.target.invoke, *args, **kwargs)
+
+    def _timed(self, fn, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.samples.append(time.perf_counter() - started)
+
+# --- Corpus ---
+def default_corpus():
+    """One round: an employee logs in, asks about themselves, applies for leave, then FAQ and policy questions."""
+    with open("data/employees.json", "r") as f:
+        employee_id = json.load(f)[0]["employee_id"]
+    with open("data/faqs.json", "r") as f:
+        faq_questions = list(json.load(f))[:5]
+    corpus = [
+        {"session": "employee", "tier": "employee_lookup", "query": employee_id},
+        {"session": "employee", "tier": "employee_lookup", "query": "What is my name?"},
+        {"session": "employee", "tier": "employee_lookup", "query": "What is my employee id?"},
+        {"session": "employee", "tier": "task_flow", "query": "I want to apply for leave"},
+        {"session": "employee", "tier": "task_flow", "query": "sick"},
+        {"session": "employee", "tier": "task_flow", "query": "2024-07-01 to 2024-07-02"},
+        {"session": "employee", "tier": "task_flow", "query": "yes"},
+    ]
+    corpus += [{"session": "faq", "tier": "faq", "query": q} for q in faq_questions]
+    corpus += [{"session": "policy", "tier": "rag", "query": q} for q in RAG_QUESTIONS]
+    return corpus
+
+def load_corpus(path):
+    """JSON lines of {"session", "tier", "query"}; tier is one of task_flow, employee_lookup, faq, rag."""
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+# --- Measurement ---
+def summarize(samples):
+    ms = np.asarray(samples) * 1000
+    return {
+        "count": len(samples),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+        # Requests per second if this tier had the process to itself.
+        "throughput_rps": round(len(samples) / (ms.sum() / 1000), 1),
+    }
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def run_benchmark(corpus, rounds, warmup, llm_delay, answer_cache, llm=None):
+    from app.core import ChatbotCore
+    from app.outbox import EmailOutbox
+
+    outbox_dir = tempfile.mkdtemp(prefix="bench-outbox-")
+    started = time.perf_counter()
+    chatbot = ChatbotCore(
+        llm=llm or StubChatModel(delay=llm_delay),
+        outbox=EmailOutbox(os.path.join(outbox_dir, "outbox.sqlite"), settings=StubSmtpSettings()),
+    )
+    startup_seconds = time.perf_counter() - started
+    if not answer_cache:
+        chatbot.answer_cache.threshold = float("inf")
+
+    samples = {tier: [] for tier in TIERS}
+    retrieval, llm = [], []
+    chatbot._retrieve = Timed(chatbot._retrieve, retrieval)
+    chatbot.qa_chain = Timed(chatbot.qa_chain, llm)
+    chatbot.condense_chain = Timed(chatbot.condense_chain, llm)
+
+    unexpected = 0
+    wall_started = None
+    for round_number in range(warmup + rounds):
+        if round_number == warmup:
+            for tier_samples in (*samples.values(), retrieval, llm):
+                tier_samples.clear()
+            wall_started = time.perf_counter()
+        for item in corpus:
+            retrievals_before = len(retrieval)
+            started = time.perf_counter()
+            chatbot.get_answer(item["query"], item["session"])
+            samples[item["tier"]].append(time.perf_counter() - started)
+            if (len(retrieval) > retrievals_before) != (item["tier"] == "rag"):
+                unexpected += 1
+    wall_seconds = time.perf_counter() - wall_started
+    samples["retrieval"], samples["llm"] = retrieval, llm
+    chatbot.outbox.close()
+
+    return {
+        "run": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "index_version": chatbot.index_version,
+            "rounds": rounds,
+            "requests": rounds * len(corpus),
+            "llm_delay_seconds": llm_delay,
+            "answer_cache": answer_cache,
+        },
+        "startup_seconds": round(startup_seconds, 3),
+        "peak_rss_mb": peak_rss_mb(),
+        "throughput_rps": round(rounds * len(corpus) / wall_seconds, 1),
+        "unexpected_tier": unexpected,
+        "emails_sent": StubSMTP.sent,
+        "tiers": {tier: summarize(s) for tier, s in samples.items() if s},
+    }
+
+# --- Comparing runs ---
+def find_regressions(results, baseline, tolerance, slack_ms):
+    """Tier p95s, startup time and peak RSS that grew by more than `tolerance` (plus `slack_ms` for timings)."""
+    regressions = []
+    for tier, stats in results["tiers"].items():
+        old = baseline.get("tiers", {}).get(tier)
+        if old and stats["p95_ms"] > old["p95_ms"] * (1 + tolerance) + slack_ms:
+            regressions.append(f"{tier} p95 {old['p95_ms']:.2f}ms -> {stats['p95_ms']:.2f}ms")
+    if "startup_seconds" in baseline and results["startup_seconds"] > baseline["startup_seconds"] * (1 + tolerance) + slack_ms / 1000:
+        regressions.append(f"startup {baseline['startup_seconds']:.2f}s -> {results['startup_seconds']:.2f}s")
+    if "peak_rss_mb" in baseline and results["peak_rss_mb"] > baseline["peak_rss_mb"] * (1 + tolerance):
+        regressions.append(f"peak RSS {baseline['peak_rss_mb']:.0f}MB -> {results['peak_rss_mb']:.0f}MB")
+    return regressions
+
+def print_report(results):
+    print(f"\n--- {results['run']['requests']} requests, {results['throughput_rps']} req/s overall ---")
+    print(f"Startup: {results['startup_seconds']:.2f}s   Peak RSS: {results['peak_rss_mb']:.0f}MB")
+    print(f"{'tier':<16}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}")
+    for tier, stats in results["tiers"].items():
+        print(f"{tier:<16}{stats['count']:>7}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}{stats['throughput_rps']:>10.1f}")
+    if results["unexpected_tier"]:
+        print(f"‼️ {results['unexpected_tier']} requests were served by a different tier than the corpus expects.")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline latency benchmark for ChatbotCore.get_answer.")
+    parser.add_argument("--corpus", help="JSON lines corpus (default: built-in corpus from data/)")
+    parser.add_argument("--rounds", type=int, default=20, help="times the corpus is replayed")
+    parser.add_argument("--warmup", type=int, default=1, help="rounds run before timing starts")
+    parser.add_argument("--llm-delay", type=float, default=0.0, help="seconds the stub LLM waits per call")
+    parser.add_argument("--llm-server", action="store_true", help="call app.llm_stub over HTTP through the pooled LLM client")
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0, help="with --llm-server: share of calls answered with a 503")
+    parser.add_argument("--llm-slow-rate", type=float, default=0.0, help="with --llm-server: share of calls that take --llm-slow-ms")
+    parser.add_argument("--llm-slow-ms", type=float, default=3000)
+    parser.add_argument("--answer-cache", action="store_true", help="let repeated policy questions hit the answer cache")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="earlier results JSON; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown (default 20%%)")
+    parser.add_argument("--slack-ms", type=float, default=1.0, help="absolute slack so microsecond tiers don't flap")
+    args = parser.parse_args(argv)
+
+    # Keep the run self-contained: no persisted answer cache, no real credentials needed.
+    os.environ["ANSWER_CACHE_PATH"] = ""
+    corpus = load_corpus(args.corpus) if args.corpus else default_corpus()
+    llm, stub = None, None
+    if args.llm_server:
+        from app.llm_client import build_chat_model
+        from app.llm_stub import StubSettings, serve
+
+        settings = StubSettings(args.llm_delay * 1000, 0, args.llm_failure_rate, args.llm_slow_rate, args.llm_slow_ms)
+        stub = serve(port=0, settings=settings)
+        llm = build_chat_model("bench", base_url=f"http://127.0.0.1:{stub.server_address[1]}/v1")
+    results = run_benchmark(corpus, args.rounds, args.warmup, args.llm_delay, args.answer_cache, llm)
+    if stub is not None:
+        results["run"]["llm_server"] = settings.counts
+        stub.shutdown()
+    print_report(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance, args.slack_ms)
+        for regression in regressions:
+            print(f"❌ Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        print("✅ No regressions against the baseline.")
+
+if __name__ == "__main__":
+    main()
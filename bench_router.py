@@ -0,0 +1,83 @@
+# bench_router.py
+import time
+from app.intents import INTENTS, IntentRouter
+
+# --- Configuration ---
+ITERATIONS = 20000
+SYNTHETIC_INTENTS = 50
+MESSAGES = [
+    "What is the dress code policy?",
+    "I want to file a new expense claim for travel",
+    "How do I apply for annual leave?",
+    "what is my name",
+    "What is my employee id?",
+    "how many leave days do I have left",
+    "Can I work from home on Fridays?",
+    "Tell me about the reimbursement process for software licenses and how long approvals usually take",
+]
+
+def route_with_scans(query):
+    """The original if-chain from ChatbotCore, one query.lower() per check."""
+    intents = []
+    action_words = ["file", "claim", "submit", "add", "new"]
+    topic_words_expense = ["expense", "reimbursement"]
+    if any(word in query.lower() for word in action_words) and any(word in query.lower() for word in topic_words_expense):
+        intents.append("file_expense")
+    if "apply" in query.lower() and "leave" in query.lower():
+        intents.append("apply_leave")
+    query_lower = query.lower()
+    if "my name" in query_lower:
+        intents.append("ask_name")
+    if "my id" in query_lower or "my employee id" in query_lower:
+        intents.append("ask_id")
+    if "my leave" in query_lower or "how many leave" in query_lower:
+        intents.append("ask_leave_balance")
+    return intents
+
+def scans_for(intents):
+    """The same if-chain generalised to any intent table: one scan per keyword per check."""
+    def route(query):
+        return [
+            intent["name"] for intent in intents
+            if all(any(word in query.lower() for word in group) for group in intent["all_of"])
+        ]
+    return route
+
+def synthetic_intents(count):
+    return [
+        {"name": f"synthetic_{i}", "all_of": [[f"verb{i}", f"action{i}"], [f"topic{i}", f"subject{i}"]]}
+        for i in range(count)
+    ]
+
+def time_per_message(route):
+    started = time.perf_counter()
+    for _ in range(ITERATIONS):
+        for message in MESSAGES:
+            route(message)
+    return (time.perf_counter() - started) / (ITERATIONS * len(MESSAGES)) * 1e6
+
+def bench_router():
+    """
+    Times the compiled IntentRouter against the original substring scans and
+    checks both route every sample message the same way. Re-run it after
+    adding intents to INTENTS.
+    """
+    router = IntentRouter()
+    for message in MESSAGES:
+        expected, got = route_with_scans(message), router.match(message).intents
+        if expected != got:
+            print(f"❌ Routing differs for {message!r}: scans={expected} router={got}")
+            return
+
+    print(f"--- {len(INTENTS)} intents, {len(MESSAGES)} messages x {ITERATIONS} iterations ---")
+    print(f"Substring scans : {time_per_message(route_with_scans):.2f} µs/message")
+    print(f"Compiled router : {time_per_message(router.match):.2f} µs/message")
+
+    # How each approach grows as intents are added.
+    intents = INTENTS + synthetic_intents(SYNTHETIC_INTENTS)
+    print(f"\n--- {len(intents)} intents ({SYNTHETIC_INTENTS} synthetic) ---")
+    print(f"Substring scans : {time_per_message(scans_for(intents)):.2f} µs/message")
+    print(f"Compiled router : {time_per_message(IntentRouter(intents).match):.2f} µs/message")
+
+if __name__ == "__main__":
+    bench_router()
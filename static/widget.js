@@ -8,6 +8,17 @@ document.addEventListener("DOMContentLoaded", () => {
     const chatInput = document.getElementById("chatbot-input");
     const suggestionArea = document.getElementById("suggestion-area");
 
+    // --- Per-tab session id so the backend keeps each user's flow separate ---
+    const getSessionId = () => {
+        let id = sessionStorage.getItem("chatbot-session-id");
+        if (!id) {
+            id = (window.crypto && crypto.randomUUID) ? crypto.randomUUID() : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+            sessionStorage.setItem("chatbot-session-id", id);
+        }
+        return id;
+    };
+    const sessionId = getSessionId();
+
     const welcomeMessage = "Welcome Employee,\nHow can I help you with MPC policies today?\nYou can provide your Employee ID for personalized assistance";
 
     // --- Event Listeners ---
@@ -26,7 +37,11 @@ document.addEventListener("DOMContentLoaded", () => {
         welcomeBubble.textContent = "";
         typeMessage(welcomeBubble, welcomeMessage);
         try {
-            await fetch('http://127.0.0.1:5000/reset', { method: 'POST' });
+            await fetch('http://127.0.0.1:5000/reset', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ session_id: sessionId })
+            });
         } catch (error) {
             console.error("Could not reset backend memory:", error);
         }
@@ -76,20 +91,55 @@ document.addEventListener("DOMContentLoaded", () => {
                 messageContainer.scrollTop = messageContainer.scrollHeight;
             } else {
                 clearInterval(typingInterval);
-                const lowerText = text.toLowerCase();
-                if (lowerText.includes("what type of leave")) {
-                    showLeaveTypeChoices();
-                } else if (lowerText.includes("what category does this expense")) {
-                    showExpenseTypeChoices();
-                } else if (lowerText.includes("select the date")) {
-                    showCalendar();
-                } else if (lowerText.includes("upload a photo or pdf")) {
-                    showUploadButton();
-                }
+                showFollowUpControls(text);
             }
         }, interval);
     };
 
+    // --- Shows the buttons/calendar/upload a finished bot reply asks for ---
+    const showFollowUpControls = (text) => {
+        const lowerText = text.toLowerCase();
+        if (lowerText.includes("what type of leave")) {
+            showLeaveTypeChoices();
+        } else if (lowerText.includes("what category does this expense")) {
+            showExpenseTypeChoices();
+        } else if (lowerText.includes("select the date")) {
+            showCalendar();
+        } else if (lowerText.includes("upload a photo or pdf")) {
+            showUploadButton();
+        }
+    };
+
+    // --- Reads the /chat/stream server-sent events and renders them as they arrive ---
+    const streamReply = async (response, element) => {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        let streamedText = "";
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            const events = buffer.split("\n\n");
+            buffer = events.pop();
+            for (const rawEvent of events) {
+                if (!rawEvent.startsWith("data: ")) continue;
+                const event = JSON.parse(rawEvent.slice(6));
+                if (event.type === "answer") {
+                    // FAQ and task-flow replies arrive whole; keep the typewriter effect for them.
+                    typeMessage(element, event.text);
+                } else if (event.type === "token") {
+                    streamedText += event.text;
+                    element.textContent += event.text;
+                    messageContainer.scrollTop = messageContainer.scrollHeight;
+                } else if (event.type === "error") {
+                    throw new Error(event.error);
+                }
+            }
+        }
+        if (streamedText) showFollowUpControls(streamedText);
+    };
+
     // --- Interactive UI Functions ---
     const clearChoiceBubbles = () => {
         const existingBubbles = document.querySelector('.choice-bubble-container');
@@ -180,16 +230,15 @@ document.addEventListener("DOMContentLoaded", () => {
             if (file) {
                 button.textContent = "Uploading...";
                 button.disabled = true;
-                const formData = new FormData();
-                formData.append("file", file);
                 try {
-                    const response = await fetch('http://127.0.0.1:5000/upload', {
+                    // The file is the request body; the server streams it to disk as it arrives.
+                    const response = await fetch(`http://127.0.0.1:5000/upload?filename=${encodeURIComponent(file.name)}`, {
                         method: 'POST',
-                        body: formData,
+                        body: file,
                     });
                     const data = await response.json();
                     if (response.ok) {
-                        chatInput.value = `receipt_uploaded: ${data.file_path}`;
+                        chatInput.value = `receipt_uploaded: ${data.handle}`;
                         chatForm.dispatchEvent(new Event('submit'));
                         container.remove();
                     } else {
@@ -221,14 +270,13 @@ document.addEventListener("DOMContentLoaded", () => {
         const botMessageBubble = botMessageWrapper.querySelector('.chat-message');
         botMessageBubble.textContent = "";
         try {
-            const response = await fetch('http://127.0.0.1:5000/chat', {
+            const response = await fetch('http://127.0.0.1:5000/chat/stream', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ message: userText })
+                body: JSON.stringify({ message: userText, session_id: sessionId })
             });
             if (!response.ok) { throw new Error("Network response was not ok."); }
-            const data = await response.json();
-            typeMessage(botMessageBubble, data.response);
+            await streamReply(response, botMessageBubble);
         } catch (error) {
             console.error("Fetch Error:", error);
             typeMessage(botMessageBubble, "Sorry, I'm having trouble connecting.");
@@ -1,7 +1,7 @@
 # test_retrieval.py
 import os
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import SentenceTransformerEmbeddings
+from app.embeddings import SharedEncoder
+from app.index_store import load_index
 
 # --- Configuration ---
 FAISS_INDEX_PATH = "data/mpc_faiss_index"
@@ -20,8 +20,9 @@ def test_retrieval():
         return
 
     try:
-        embedding_model = SentenceTransformerEmbeddings(model_name="all-MiniLM-L6-v2")
-        db = FAISS.load_local(FAISS_INDEX_PATH, embedding_model, allow_dangerous_deserialization=True)
+        embedding_model = SharedEncoder()
+        # Handles both app.ingest's pickle-free format and the original LangChain save_local one.
+        db = load_index(FAISS_INDEX_PATH, embedding_model)
         print("✅ Index loaded successfully.")
     except Exception as e:
         print(f"❌ An error occurred while loading the index: {e}")